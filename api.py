@@ -1,13 +1,28 @@
 # api.py (IMPROVED VERSION)
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-import psycopg2
-from typing import List, Optional
-import joblib
-import pandas as pd
+from typing import Dict, List, Literal, Optional
+import anyio
+import json
+import numpy as np
 import os
+import threading
 from datetime import datetime
 
+# Pooled database access lives in db.py; get_db_connection stays importable
+# from here for scripts (optimizing_db, notebooks) that want their own connection
+from batching import MicroBatcher
+from db import get_db_connection, get_pool, run_db
+from features import INPUT_FIELDS, build_features, load_model, risk_levels
+import metrics
+import rollups
+from serialization import (
+    MEDIA_TYPES, chunked, decode_cursor, dumps, encode_cursor, encode_row, encode_rows, iter_encoded
+)
+from trade_queries import TRADE_FIELDS, TRADE_SELECT
+
 # Initialize FastAPI with better metadata
 app = FastAPI(
     title="  Trade API", 
@@ -16,22 +31,8 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc"
 )
-
-# Database connection with error handling
-def get_db_connection():
-    # try:
-    #     conn = psycopg2.connect(
-    #         host="localhost",       # ← FIX: Use localhost for external connection  
-    #         port=5435,             # ← MUST match the external port in docker-compose (5435:5432)
-    #         dbname="trading_db",
-    #         user="trader",
-    #         password="securepass123",
-    #         connect_timeout=10
-    #     )
-    #     return conn
-    # except psycopg2.Error as e:
-    #     raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
-    return psycopg2.connect(os.environ["DATABASE_URL"])
+# Per-route latency, status and response bytes, served on /metrics
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Pydantic models with more fields
 class Trade(BaseModel):
@@ -50,9 +51,12 @@ class Trade(BaseModel):
 class PredictionRequest(BaseModel):
     quantity: float
     price: float
-    trade_hour: int
-    is_sell_order: bool
-    symbol: Optional[str] = None  # Added symbol for better predictions
+    is_margin_trade: bool = False
+    value_at_risk: Optional[float] = None  # estimated from notional when omitted
+    # Accepted for compatibility; not features of the current model
+    trade_hour: Optional[int] = None
+    is_sell_order: Optional[bool] = None
+    symbol: Optional[str] = None
 
 class HealthCheck(BaseModel):
     status: str
@@ -63,7 +67,8 @@ class HealthCheck(BaseModel):
 # Load ML model with better error handling
 try:
     model_path = os.path.join(os.path.dirname(__file__), 'failure_predictor.pkl')
-    model = joblib.load(model_path)
+    # Compiled forest (see forest.py), checked against the feature schema in features.py
+    model = load_model(model_path).warm()   # first /predict-failure pays no page faults
     MODEL_LOADED = True
 except Exception as e:
     model = None
@@ -75,51 +80,246 @@ except Exception as e:
 async def root():
     return {"message": "Trade API Running - Visit /docs for API documentation"}
 
-@app.get("/trades", response_model=List[Trade])
+def _setting(name: str, default, cast, minimum):
+    """Numeric setting from the environment; an invalid value fails at startup, naming the variable"""
+    raw = os.environ.get(name, default)
+    try:
+        value = cast(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {raw!r}") from None
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}, got {raw!r}")
+    return value
+
+# Responses above this many rows are streamed in chunks instead of encoded in one piece
+STREAM_THRESHOLD = 250
+STREAM_CHUNK_ROWS = 250
+
+# Rows pulled per round trip by the server-side cursor behind /trades/export
+EXPORT_BATCH_ROWS = 10_000
+
+# Exports run on their own connections, outside the pool; cap how many run at once
+EXPORT_MAX_CONCURRENT = _setting("EXPORT_MAX_CONCURRENT", 4, int, 1)
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+# Blocking query helpers; handlers run them through run_db so a slow query
+# occupies a DB worker thread instead of the event loop
+def _trade_filters(symbol=None, status=None, since=None, until=None):
+    conditions = []
+    params = []
+
+    if symbol:
+        conditions.append("symbol = %s")
+        params.append(symbol)
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+    if since:
+        conditions.append("trade_date >= %s")
+        params.append(since)
+    if until:
+        conditions.append("trade_date < %s")
+        params.append(until)
+    return conditions, params
+
+def _fetch_trades(conn, limit, symbol, status, after=None):
+    conditions, params = _trade_filters(symbol, status)
+
+    # Keyset pagination: resume strictly after the last (trade_date, trade_id)
+    # served, so every page is an index range scan regardless of depth
+    if after:
+        conditions.append("(trade_date, trade_id) < (%s, %s)")
+        params.extend(after)
+
+    query = TRADE_SELECT
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY trade_date DESC, trade_id DESC LIMIT %s"
+    params.append(limit)
+
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+def _export_batches(symbol, status, since, until):
+    """Yield row batches from a named (server-side) cursor on a dedicated connection.
+
+    An export holds its connection for as long as the client takes to read,
+    so it never draws on the pool the other endpoints share.
+    """
+    conditions, params = _trade_filters(symbol, status, since, until)
+    query = TRADE_SELECT
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY trade_date DESC, trade_id DESC"
+
+    conn = get_db_connection()
+    try:
+        # Timed from execute to the last batch, so it includes the time the client takes to read
+        with metrics.db_query("api.export_trades") as timer, conn.cursor(name="trades_export") as cur:
+            cur.itersize = EXPORT_BATCH_ROWS
+            cur.execute(query, params)
+            while True:
+                batch = cur.fetchmany(EXPORT_BATCH_ROWS)
+                if not batch:
+                    break
+                timer.rows += len(batch)
+                yield batch
+    finally:
+        conn.close()
+
+async def _stream_export(batches, format):
+    """Encode export batches off the event loop; closes the cursor and connection even if the client disconnects"""
+    body = iter_encoded(TRADE_FIELDS, batches, format)
+    try:
+        async for chunk in iterate_in_threadpool(body):
+            yield chunk
+    finally:
+        # Shielded: on disconnect this runs inside a cancelled scope
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(body.close)
+            await run_in_threadpool(batches.close)
+
+class _ExportResponse(StreamingResponse):
+    """StreamingResponse that closes its body and frees its export slot however the response ends"""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Shielded: on disconnect this runs inside a cancelled scope
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+            export_slots.release()
+
+def _fetch_trade(conn, trade_id):
+    with conn.cursor() as cur:
+        cur.execute(TRADE_SELECT + " WHERE trade_id = %s", (trade_id,))
+        return cur.fetchone()
+
+def _fetch_summary(conn):
+    # Constant-time read of the rollup state instead of a scan of trades (rollups.py)
+    return rollups.summary(conn)
+
+def _ping(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1")
+        cur.fetchone()
+
+# Handlers below encode their own bodies, so the schemas are documented here, not applied through response_model
+_ENCODED_FORMATS = {MEDIA_TYPES['ndjson']: {"schema": {"type": "string", "description": "One Trade object per line"}},
+                    MEDIA_TYPES['csv']: {"schema": {"type": "string", "description": "Header row, then one trade per row"}}}
+
+@app.get("/trades", response_class=Response, responses={200: {
+    "model": List[Trade],
+    "description": "Trades newest first, encoded as `format`",
+    "content": _ENCODED_FORMATS,
+    "headers": {"X-Next-Cursor": {"description": "Pass as `cursor` to fetch the next page; absent on the last page",
+                                  "schema": {"type": "string"}}},
+}})
 async def get_trades(
     limit: int = Query(100, ge=1, le=1000, description="Number of trades to return"),
     symbol: Optional[str] = Query(None, description="Filter by symbol"),
-    status: Optional[str] = Query(None, description="Filter by status (e.g., FAILED, SETTLED)")
+    status: Optional[str] = Query(None, description="Filter by status (e.g., FAILED, SETTLED)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    format: Literal["json", "ndjson", "csv"] = Query("json", description="Response encoding")
 ):
-    """Get trades with optional filtering"""
-    conn = get_db_connection()
+    """Get trades with optional filtering, newest first.
+
+    When more rows remain, the X-Next-Cursor response header carries the
+    token to pass as `cursor` for the next page.
+    """
     try:
-        query = "SELECT trade_id, symbol, quantity, price, status, value_at_risk, trade_date, failure_reason FROM trades"
-        conditions = []
-        params = []
-        
-        if symbol:
-            conditions.append("symbol = %s")
-            params.append(symbol)
-        if status:
-            conditions.append("status = %s")
-            params.append(status)
-            
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-            
-        query += f" ORDER BY trade_date DESC LIMIT {limit}"
-        
-        df = pd.read_sql(query, conn, params=params if params else None)
-        return df.to_dict('records')
-    finally:
-        conn.close()
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/trades/{trade_id}", response_model=Trade)
+    # One extra row tells us whether another page exists
+    rows = await run_db(_fetch_trades, limit + 1, symbol, status, after)
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last[TRADE_FIELDS.index("trade_date")], last[0])
+
+    if len(rows) > STREAM_THRESHOLD:
+        return StreamingResponse(
+            iter_encoded(TRADE_FIELDS, chunked(rows, STREAM_CHUNK_ROWS), format),
+            media_type=MEDIA_TYPES[format],
+            headers=headers
+        )
+    return Response(encode_rows(TRADE_FIELDS, rows, format), media_type=MEDIA_TYPES[format], headers=headers)
+
+@app.get("/trades/export", response_class=StreamingResponse, responses={
+    200: {"model": List[Trade], "description": "Every matching trade, encoded as `format`", "content": _ENCODED_FORMATS},
+    503: {"description": "EXPORT_MAX_CONCURRENT exports are already running; retry after Retry-After seconds"},
+})
+async def export_trades(
+    symbol: Optional[str] = Query(None, description="Filter by symbol"),
+    status: Optional[str] = Query(None, description="Filter by status (e.g., FAILED, SETTLED)"),
+    since: Optional[datetime] = Query(None, description="Only trades on or after this trade_date"),
+    until: Optional[datetime] = Query(None, description="Only trades before this trade_date"),
+    format: Literal["json", "ndjson", "csv"] = Query("ndjson", description="Response encoding")
+):
+    """Stream every matching trade using a server-side cursor, in constant memory.
+
+    At most EXPORT_MAX_CONCURRENT exports run at once; beyond that the
+    request gets 503 with a Retry-After header.
+    """
+    if not export_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Too many concurrent exports, retry later",
+                            headers={"Retry-After": "5"})
+    return _ExportResponse(
+        _stream_export(_export_batches(symbol, status, since, until), format),
+        media_type=MEDIA_TYPES[format]
+    )
+
+@app.get("/trades/{trade_id}", response_class=Response, responses={
+    200: {"model": Trade, "description": "The trade"},
+    404: {"description": "Trade not found"},
+})
 async def get_trade(trade_id: str):
     """Get a specific trade by ID"""
-    conn = get_db_connection()
-    try:
-        df = pd.read_sql(
-            "SELECT trade_id, symbol, quantity, price, status, value_at_risk, trade_date, failure_reason FROM trades WHERE trade_id = %s",
-            conn, 
-            params=[trade_id]
-        )
-        if df.empty:
-            raise HTTPException(status_code=404, detail="Trade not found")
-        return df.iloc[0].to_dict()
-    finally:
-        conn.close()
+    row = await run_db(_fetch_trade, trade_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Trade not found")
+    return Response(encode_row(TRADE_FIELDS, row), media_type=MEDIA_TYPES['json'])
+
+# Upper bound on rows accepted by one /predict-failure/batch call
+PREDICT_MAX_BATCH = _setting("PREDICT_MAX_BATCH", 10_000, int, 1)
+
+def _score(features: np.ndarray) -> np.ndarray:
+    """Failure probabilities for a whole batch in one predict_proba call"""
+    metrics.MODEL_BATCH_ROWS.observe(len(features))
+    with metrics.MODEL_PREDICT_SECONDS.time():
+        return model.predict_proba(features)[:, 1]
+
+# Concurrent single-trade requests are coalesced into one predict_proba call
+# per window (PREDICT_BATCH_WINDOW_MS) or per PREDICT_BATCH_MAX_ROWS rows
+prediction_batcher = MicroBatcher(
+    _score,
+    max_rows=_setting("PREDICT_BATCH_MAX_ROWS", 256, int, 1),
+    max_wait=_setting("PREDICT_BATCH_WINDOW_MS", 2, float, 0) / 1000,
+)
+
+def _parse_prediction_batch(body: bytes, content_type: str) -> Dict[str, np.ndarray]:
+    """Columnar view of a batch sent as a JSON array, NDJSON or an Arrow IPC stream"""
+    if "arrow" in content_type:
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise HTTPException(status_code=415, detail="Arrow input requires pyarrow")
+        table = pa.ipc.open_stream(body).read_all()
+        return {f: table.column(f).to_numpy(zero_copy_only=False) for f in INPUT_FIELDS if f in table.column_names}
+
+    if "ndjson" in content_type:
+        records = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        records = json.loads(body)
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("Expected a JSON array of trades")
+    return {f: [record.get(f) for record in records] for f in INPUT_FIELDS}
 
 @app.post("/predict-failure")
 async def predict_failure(request: PredictionRequest):
@@ -128,55 +328,100 @@ async def predict_failure(request: PredictionRequest):
         raise HTTPException(status_code=503, detail="Prediction model not available")
     
     try:
-        # Prepare features - enhanced with symbol risk if provided
-        features = [[
-            request.quantity,
-            abs(request.quantity),
-            request.price,
-            request.trade_hour,
-            0,  # dummy day of week (could be improved)
-            request.quantity * request.price,
-            1 if request.is_sell_order else 0
-        ]]
-        
-        probability = model.predict_proba(features)[0][1]
+        features = build_features({f: [getattr(request, f)] for f in INPUT_FIELDS})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid trade: {e}")
+    # Rejected here rather than in the micro-batch, where it would fail the requests sharing it
+    if not np.isfinite(features).all():
+        raise HTTPException(status_code=422, detail="Invalid trade: features must be finite")
+
+    try:
+        probability = await prediction_batcher.submit(features[0])
         return {
             "failure_probability": round(probability, 4),
-            "risk_level": "HIGH" if probability > 0.7 else "MEDIUM" if probability > 0.3 else "LOW"
+            "risk_level": str(risk_levels(probability))
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+@app.post("/predict-failure/batch")
+async def predict_failure_batch(request: Request):
+    """Score many trades with one vectorized predict_proba call.
+
+    Accepts a JSON array of PredictionRequest objects, NDJSON
+    (application/x-ndjson) or an Arrow IPC stream
+    (application/vnd.apache.arrow.stream). Results come back in input order.
+    """
+    if not model:
+        raise HTTPException(status_code=503, detail="Prediction model not available")
+
+    body = await request.body()
+    try:
+        cols = _parse_prediction_batch(body, request.headers.get("content-type", ""))
+        n = len(cols["quantity"])
+        if n > PREDICT_MAX_BATCH:
+            raise HTTPException(status_code=413, detail=f"Batch of {n} exceeds the limit of {PREDICT_MAX_BATCH}")
+        features = build_features(cols)
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid batch: {e}")
+    bad = np.flatnonzero(~np.isfinite(features).all(axis=1))
+    if len(bad):
+        raise HTTPException(status_code=422,
+                            detail=f"Invalid batch: non-finite features in rows {bad[:10].tolist()}")
+
+    if n == 0:
+        return Response("[]", media_type=MEDIA_TYPES['json'])
+
+    try:
+        probabilities = await run_in_threadpool(_score, features)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+
+    results = [
+        {"failure_probability": p, "risk_level": level}
+        for p, level in zip(np.round(probabilities, 4).tolist(), risk_levels(probabilities).tolist())
+    ]
+    with metrics.SERIALIZE_SECONDS.time(format='json'):
+        body = dumps(results)
+    return Response(body, media_type=MEDIA_TYPES['json'])
+
 @app.get("/stats/summary")
 async def get_stats_summary():
     """Get summary statistics"""
-    conn = get_db_connection()
-    try:
-        stats = pd.read_sql("""
-            SELECT 
-                COUNT(*) as total_trades,
-                SUM(CASE WHEN status = 'FAILED' THEN 1 ELSE 0 END) as failed_trades,
-                AVG(CASE WHEN status = 'FAILED' THEN 1 ELSE 0 END) as failure_rate,
-                SUM(value_at_risk) as total_value_at_risk,
-                MAX(trade_date) as latest_trade_date
-            FROM trades
-        """, conn)
-        return stats.iloc[0].to_dict()
-    finally:
-        conn.close()
+    return await run_db(_fetch_summary)
+
+@app.post("/stats/rollups/refresh")
+async def refresh_rollups():
+    """Fold trades created since the last refresh into the summary rollups"""
+    return await run_db(rollups.refresh)
+
+@app.get("/stats/pool")
+async def get_pool_stats():
+    """Database connection pool metrics"""
+    return get_pool().stats()
+
+@app.get("/stats/predict-batching")
+async def get_predict_batching_stats():
+    """Micro-batching metrics for /predict-failure: batch sizes and queue wait"""
+    return prediction_batcher.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Latency, throughput and pool metrics for this process, in the Prometheus text format"""
+    pool = get_pool().stats()
+    for state in ('size', 'idle', 'in_use'):
+        metrics.DB_POOL_CONNECTIONS.set(pool[state], state=state)
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/health", response_model=HealthCheck)
 async def health_check():
     """Health check endpoint"""
-    conn = get_db_connection()
     try:
         # Test database connection
-        pd.read_sql("SELECT 1", conn)
+        await run_db(_ping)
         db_status = "connected"
-    except:
+    except Exception:
         db_status = "disconnected"
-    finally:
-        conn.close()
     
     return HealthCheck(
         status="healthy",
@@ -0,0 +1,250 @@
+# batch_scoring.py
+"""Offline failure scoring: writes failure_probability and risk_level back to trades.
+
+    python batch_scoring.py                # score trades added since the last run
+    python batch_scoring.py --every 60     # keep scoring every 60 seconds
+    python batch_scoring.py --workers 8
+    python batch_scoring.py --rescore      # score every trade again
+
+Trades are scored in id ranges of CHUNK_ROWS, one range per task in a
+process pool. A worker streams its range through a server-side cursor and
+scores it with one predict_proba call on the mmap'd forest, whose pages
+every worker shares. It then COPYs (id, probability, level) into a
+temporary staging table and merges that into trades with one UPDATE ...
+FROM. Each range commits on its own.
+
+trade_scoring_state holds the checkpoint: the id up to which every trade is
+scored, and the model that scored it. The checkpoint advances only over
+ranges that finished in order. After a crash the next run resumes at the
+first unfinished range; scoring a range twice is harmless. A different
+model (fingerprint) restarts from id 0.
+
+PENDING trades are rescored at most every PENDING_RESCORE_SECONDS, so
+their scores follow in-place updates until they settle; unchanged scores
+are not rewritten. Rows committed more than `lag` seconds after their id was
+assigned can fall behind the checkpoint; --rescore picks them up.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db import connection, get_db_connection
+from features import INPUT_FIELDS, build_features, load_model, risk_levels
+
+CHUNK_ROWS = 50_000
+FETCH_ROWS = 10_000                 # rows per round trip of the server-side cursor
+PENDING_RESCORE_SECONDS = 3600
+SCORING_LOCK_ID = 7_240_023         # pg advisory lock: one scoring job at a time
+
+SCORE_COLUMNS = {'failure_probability': 'REAL', 'risk_level': 'VARCHAR(8)'}
+
+STATE_SQL = """
+CREATE TABLE IF NOT EXISTS trade_scoring_state (
+    id INT PRIMARY KEY CHECK (id = 1),
+    model_key TEXT,
+    checkpoint_id BIGINT NOT NULL DEFAULT 0,
+    pending_rescored_at TIMESTAMPTZ,
+    refreshed_at TIMESTAMPTZ
+);
+INSERT INTO trade_scoring_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+"""
+
+STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS trade_scores_staging (
+    id INT NOT NULL,
+    failure_probability REAL NOT NULL,
+    risk_level VARCHAR(8) NOT NULL
+) ON COMMIT DELETE ROWS
+"""
+
+SELECT_SQL = (
+    "SELECT id, quantity::float8, price::float8, is_margin_trade, value_at_risk::float8 "
+    "FROM trades WHERE id > %s AND id <= %s"
+)
+
+# Only rows whose score changed are rewritten, so rescoring leaves no dead tuples behind
+MERGE_SQL = """
+UPDATE trades t
+SET failure_probability = s.failure_probability, risk_level = s.risk_level
+FROM trade_scores_staging s
+WHERE t.id = s.id AND t.id > %s AND t.id <= %s
+  AND t.failure_probability IS DISTINCT FROM s.failure_probability
+"""
+
+def ensure_schema(conn):
+    """Add the score columns to trades (only if missing: ALTER TABLE locks trades) and the state table"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = 'trades' AND column_name = ANY(%s)",
+            (list(SCORE_COLUMNS),),
+        )
+        present = {name for (name,) in cur.fetchall()}
+        for name, sql_type in SCORE_COLUMNS.items():
+            if name not in present:
+                cur.execute(f"ALTER TABLE trades ADD COLUMN IF NOT EXISTS {name} {sql_type}")
+        cur.execute(STATE_SQL)
+    conn.commit()
+
+def model_key(model) -> str:
+    """Fingerprint of the compiled forest; scores from a different model are redone"""
+    digest = hashlib.sha1(json.dumps(model.meta, sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(model.leaf_value).tobytes())
+    return digest.hexdigest()[:16]
+
+_model = None
+
+def _init_worker(model_path: Optional[str]):
+    global _model
+    _model = load_model(model_path) if model_path else load_model()
+
+def score_range(task: Tuple[int, int, bool]) -> int:
+    """Score trades with lo < id <= hi (PENDING only if asked) and merge them; returns rows read"""
+    lo, hi, pending_only = task
+    ids, cols = [], {field: [] for field in INPUT_FIELDS}
+    where_pending = " AND status = 'PENDING'" if pending_only else ""
+    with connection() as conn:
+        with conn.cursor(name="trades_scoring") as cur:
+            cur.itersize = FETCH_ROWS
+            cur.execute(SELECT_SQL + where_pending, (lo, hi))
+            while True:
+                rows = cur.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                batch_ids, *batch_cols = zip(*rows)
+                ids.extend(batch_ids)
+                for field, values in zip(INPUT_FIELDS, batch_cols):
+                    cols[field].extend(values)
+        if not ids:
+            conn.commit()
+            return 0
+
+        probabilities = _model.predict_proba(build_features(cols))[:, 1].astype(np.float32)
+        buf = io.StringIO()
+        buf.writelines(f"{i},{p!r},{level}\n" for i, p, level in
+                       zip(ids, probabilities.tolist(), risk_levels(probabilities).tolist()))
+        buf.seek(0)
+        with conn.cursor() as cur:
+            cur.execute(STAGING_SQL)
+            cur.copy_expert("COPY trade_scores_staging FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute("ANALYZE trade_scores_staging")   # so the merge looks rows up by id instead of scanning trades
+            cur.execute(MERGE_SQL, (lo, hi))
+        conn.commit()
+    return len(ids)
+
+def _ranges(lo: int, hi: int, chunk_rows: int, pending_only: bool = False) -> List[Tuple[int, int, bool]]:
+    return [(start, min(start + chunk_rows, hi), pending_only) for start in range(lo, hi, chunk_rows)]
+
+def _consume(tasks, results, on_done) -> int:
+    rows = 0
+    for (_, hi, _), n in zip(tasks, results):
+        rows += n
+        if on_done:
+            on_done(hi, n)
+    return rows
+
+def _run(tasks, workers: int, model_path: Optional[str], on_done=None) -> int:
+    """Score `tasks`; on_done(hi, rows) runs per range in range order, so it can checkpoint"""
+    if workers <= 1 or len(tasks) <= 1:
+        _init_worker(model_path)
+        return _consume(tasks, map(score_range, tasks), on_done)
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+        return _consume(tasks, pool.imap(score_range, tasks), on_done)
+
+def score(workers: int = os.cpu_count() or 1, chunk_rows: int = CHUNK_ROWS, lag: float = 5.0,
+          rescore: bool = False, model_path: Optional[str] = None) -> Dict[str, Any]:
+    """Score every trade past the checkpoint, and PENDING trades when due; returns what was done"""
+    lock_conn = get_db_connection()
+    try:
+        with lock_conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (SCORING_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                return {'skipped': 'another scoring job is running'}
+
+        key = model_key(load_model(model_path) if model_path else load_model())
+        with connection() as conn:
+            ensure_schema(conn)
+            with conn.cursor() as cur:
+                cur.execute("SELECT model_key, checkpoint_id, pending_rescored_at < now() - %s * INTERVAL '1 second' "
+                            "OR pending_rescored_at IS NULL FROM trade_scoring_state WHERE id = 1",
+                            (PENDING_RESCORE_SECONDS,))
+                stored_key, checkpoint, pending_due = cur.fetchone()
+                # Ids of rows created in the last `lag` seconds may still be in flight; leave them for the next run
+                cur.execute("SELECT coalesce(max(id), 0) FROM trades WHERE created_at <= now() - %s * INTERVAL '1 second'",
+                            (lag,))
+                until = cur.fetchone()[0]
+                if rescore or stored_key != key:
+                    checkpoint = 0
+                    cur.execute("UPDATE trade_scoring_state SET model_key = %s, checkpoint_id = 0 WHERE id = 1", (key,))
+            conn.commit()
+
+        started = time.perf_counter()
+        progress = {'rows': 0, 'reported': time.perf_counter()}
+
+        def advance(hi: int, n: int):
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute("UPDATE trade_scoring_state SET checkpoint_id = %s, refreshed_at = now() WHERE id = 1",
+                            (hi,))
+                conn.commit()
+            progress['rows'] += n
+            if time.perf_counter() - progress['reported'] > 10:
+                progress['reported'] = time.perf_counter()
+                elapsed = progress['reported'] - started
+                print(f"✅ Scored {progress['rows']:,} trades up to id {hi:,} ({progress['rows'] / elapsed:,.0f} rows/sec)")
+
+        scored = _run(_ranges(checkpoint, until, chunk_rows), workers, model_path, advance)
+
+        # Trades scored in this run are fresh; rescoring covers the ones scored in earlier runs
+        pending = 0
+        if checkpoint == 0 or pending_due:
+            if checkpoint > 0:
+                pending = _run(_ranges(0, checkpoint, chunk_rows, pending_only=True), workers, model_path)
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute("UPDATE trade_scoring_state SET pending_rescored_at = now() WHERE id = 1")
+                conn.commit()
+
+        # Set on every completed run, also when there was nothing to score
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE trade_scoring_state SET refreshed_at = now() WHERE id = 1")
+            conn.commit()
+    finally:
+        lock_conn.close()   # releases the advisory lock
+
+    seconds = time.perf_counter() - started
+    return {'scored': scored, 'pending_rescored': pending, 'checkpoint_id': max(checkpoint, until),
+            'seconds': seconds, 'rows_per_sec': (scored + pending) / seconds if seconds else 0.0}
+
+def status(conn) -> Dict[str, Any]:
+    """Checkpoint, model and last run of the scoring job; empty if no run has completed yet"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('trade_scoring_state') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return {}
+        cur.execute("SELECT model_key, checkpoint_id, pending_rescored_at, refreshed_at "
+                    "FROM trade_scoring_state WHERE id = 1")
+        row = cur.fetchone()
+        # refreshed_at stays NULL until a run completes (the table was just created, or the run crashed)
+        return dict(zip([col[0] for col in cur.description], row)) if row and row[3] is not None else {}
+
+if __name__ == "__main__":
+    every = float(sys.argv[sys.argv.index('--every') + 1]) if '--every' in sys.argv else None
+    workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else os.cpu_count() or 1
+    rescore = '--rescore' in sys.argv
+    while True:
+        result = score(workers=workers, rescore=rescore)
+        if 'skipped' in result:
+            print(f"⏭️  Scoring skipped: {result['skipped']}")
+        else:
+            print(f"🎯 Scored {result['scored']:,} new and {result['pending_rescored']:,} pending trades "
+                  f"in {result['seconds']:.1f}s ({result['rows_per_sec']:,.0f} rows/sec), "
+                  f"checkpoint id {result['checkpoint_id']:,}")
+        if every is None:
+            break
+        rescore = False
+        time.sleep(every)
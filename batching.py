@@ -0,0 +1,131 @@
+# batching.py
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+class MicroBatcher:
+    """Coalesce concurrent single-row scoring requests into one vectorized call.
+
+    Rows submitted within `max_wait` seconds of the first queued row (or until
+    `max_rows` are waiting) are stacked into one matrix and passed to
+    `score_fn` in a worker thread; each caller gets back its own row's result.
+    """
+
+    def __init__(self, score_fn: Callable[[np.ndarray], np.ndarray],
+                 max_rows: int = 256, max_wait: float = 0.002):
+        if max_rows < 1:
+            raise ValueError(f"max_rows must be at least 1, got {max_rows}")
+        if max_wait < 0:
+            raise ValueError(f"max_wait must not be negative, got {max_wait}")
+        self.score_fn = score_fn
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+        self._lock = threading.Lock()
+        # batch-size buckets are powers of two up to max_rows
+        self._size_buckets = [2 ** i for i in range(int(np.log2(max_rows)) + 1)]
+        if self._size_buckets[-1] < max_rows:
+            self._size_buckets.append(max_rows)
+        self._wait_buckets_ms = [0.5, 1, 2, 5, 10, 25, 50, 100]
+        self._stats = {
+            'batches': 0,
+            'rows': 0,
+            'errors': 0,
+            'queue_wait_seconds': 0.0,
+            'max_queue_wait_seconds': 0.0,
+            'batch_size': [0] * (len(self._size_buckets) + 1),
+            'queue_wait_ms': [0] * (len(self._wait_buckets_ms) + 1),
+        }
+
+    def _ensure_running(self):
+        # Started lazily so the worker task lives on whichever loop serves requests
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, row: np.ndarray) -> float:
+        """Queue one feature row and wait for its score"""
+        self._ensure_running()
+        future = self._loop.create_future()
+        self._queue.put_nowait((row, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_rows:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _record(self, batch, started):
+        waits = [started - enqueued for _, _, enqueued in batch]
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['rows'] += len(batch)
+            self._stats['batch_size'][int(np.searchsorted(self._size_buckets, len(batch)))] += 1
+            for wait in waits:
+                self._stats['queue_wait_ms'][int(np.searchsorted(self._wait_buckets_ms, wait * 1000))] += 1
+            self._stats['queue_wait_seconds'] += sum(waits)
+            self._stats['max_queue_wait_seconds'] = max(self._stats['max_queue_wait_seconds'], max(waits))
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            self._record(batch, started)
+            features = np.vstack([row for row, _, _ in batch])
+            try:
+                scores = (await self._loop.run_in_executor(None, self.score_fn, features)).tolist()
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                if len(batch) == 1:
+                    scores = [e]
+                else:
+                    # Rescore row by row, so only the request whose row caused the error fails
+                    scores = await self._loop.run_in_executor(None, self._score_each, features)
+            for (_, future, _), score in zip(batch, scores):
+                if future.done():
+                    continue
+                if isinstance(score, Exception):
+                    future.set_exception(score)
+                else:
+                    future.set_result(score)
+
+    def _score_each(self, features: np.ndarray) -> List[Any]:
+        """Score of each row, or the exception scoring it alone raised"""
+        results = []
+        for row in features:
+            try:
+                results.append(self.score_fn(row[np.newaxis, :]).tolist()[0])
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus batch-size and queue-wait histograms (bucket upper bounds)"""
+        with self._lock:
+            stats = {k: (list(v) if isinstance(v, list) else v) for k, v in self._stats.items()}
+        stats['batch_size'] = dict(zip([str(b) for b in self._size_buckets] + ['+Inf'], stats['batch_size']))
+        stats['queue_wait_ms'] = dict(zip([str(b) for b in self._wait_buckets_ms] + ['+Inf'], stats['queue_wait_ms']))
+        stats['avg_batch_size'] = stats['rows'] / stats['batches'] if stats['batches'] else 0.0
+        stats['avg_queue_wait_ms'] = 1000 * stats['queue_wait_seconds'] / stats['rows'] if stats['rows'] else 0.0
+        stats['max_rows'] = self.max_rows
+        stats['max_wait_ms'] = self.max_wait * 1000
+        return stats
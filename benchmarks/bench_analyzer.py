@@ -0,0 +1,114 @@
+# benchmarks/bench_analyzer.py
+"""Compare TradeAnalyzer's in-memory, SQL pushdown, incremental and streaming modes as the trades table grows.
+
+Reseeds the trades table (DATABASE_URL) at each size with
+parallel_generate_trades, then times every analysis in each mode:
+
+    python -m benchmarks.bench_analyzer --rows 1000000,10000000,50000000
+
+In-memory mode holds the whole 90-day window in one DataFrame; sizes above
+--memory-max-rows skip it. For incremental mode 'load' is the initial build
+and 'refresh' an empty refresh() afterwards; for streaming mode 'load' is the
+chunked pass over the window. Use --no-seed to benchmark the
+table as is.
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+from typing import Any, Dict, List
+
+from db import connection
+from smart_data_generator import parallel_generate_trades
+from trade_analysis import MODES, TradeAnalyzer
+
+ANALYSES = [
+    'basic_stats',
+    'failure_analysis_by_symbol',
+    'time_based_analysis',
+    'value_at_risk_analysis',
+    'settlement_delay_analysis',
+    'quantile_analysis',
+    'correlation_analysis',
+]
+
+def reseed(n_rows: int, seed: int):
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("TRUNCATE trades")
+        conn.commit()
+    parallel_generate_trades(n_rows, seed=seed)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("ANALYZE trades")
+        conn.commit()
+
+def _table_rows() -> int:
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM trades")
+        return cur.fetchone()[0]
+
+def _run_mode(mode: str) -> Dict[str, Any]:
+    timings = {}
+    started = time.perf_counter()
+    analyzer = TradeAnalyzer(mode)
+    timings['load'] = time.perf_counter() - started
+    for name in ANALYSES:
+        t = time.perf_counter()
+        getattr(analyzer, name)()
+        timings[name] = time.perf_counter() - t
+    if mode == 'incremental':
+        t = time.perf_counter()
+        analyzer.refresh()
+        timings['refresh'] = time.perf_counter() - t
+    return {
+        'seconds': timings,
+        'total_seconds': sum(timings.values()),
+        'first_result_seconds': timings['load'] + timings['basic_stats'],
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def run_mode(mode: str) -> Dict[str, Any]:
+    """Seconds per analysis ('load' included) and peak RSS, measured in a fresh process"""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(_run_mode, (mode,))
+
+def run(sizes: List[int], memory_max_rows: int = 10_000_000, seed: int = 42,
+        seed_table: bool = True) -> List[Dict[str, Any]]:
+    results = []
+    for n_rows in sizes:
+        if seed_table:
+            reseed(n_rows, seed)
+        n_rows = _table_rows()
+        result = {'rows': n_rows, 'pushdown': run_mode('pushdown'), 'incremental': run_mode('incremental'),
+                  'streaming': run_mode('streaming')}
+        if n_rows <= memory_max_rows:
+            result['memory'] = run_mode('memory')
+        results.append(result)
+        if not seed_table:
+            break
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="1000000,10000000,50000000", help="comma-separated table sizes")
+    parser.add_argument("--memory-max-rows", type=int, default=10_000_000,
+                        help="skip in-memory mode above this many rows")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-seed", action="store_true", help="use the current trades table")
+    args = parser.parse_args()
+
+    results = run([int(x) for x in args.rows.split(',')], args.memory_max_rows, args.seed, not args.no_seed)
+    print(f"{'rows':>12} {'mode':<12}{'first result s':>15}{'total s':>10}{'peak RSS MB':>13}")
+    for r in results:
+        for mode in MODES:
+            if mode in r:
+                m = r[mode]
+                print(f"{r['rows']:>12,} {mode:<12}{m['first_result_seconds']:>15.2f}"
+                      f"{m['total_seconds']:>10.2f}{m['peak_rss_mb']:>13.1f}")
+    for r in results:
+        print(f"\n{r['rows']:,} rows, seconds per analysis:")
+        for name in ['load'] + ANALYSES + ['refresh']:
+            line = f"  {name:<28}"
+            for mode in MODES:
+                if name in r.get(mode, {}).get('seconds', {}):
+                    line += f"{mode}: {r[mode]['seconds'][name]:>8.3f}   "
+            print(line)
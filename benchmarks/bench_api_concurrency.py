@@ -0,0 +1,68 @@
+# benchmarks/bench_api_concurrency.py
+"""Measure how /trades, /trades/{trade_id} and /stats/summary scale with concurrency.
+
+Start the API against a local Postgres first (uvicorn api:app), then:
+
+    python -m benchmarks.bench_api_concurrency --url http://localhost:8000
+"""
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+
+def _get(url: str) -> float:
+    started = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=60) as resp:
+        resp.read()
+    return time.perf_counter() - started
+
+def _load(url: str, concurrency: int, requests: int) -> Dict[str, Any]:
+    """Fire `requests` GETs at `url` from `concurrency` client threads"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(lambda _: _get(url), range(requests))))
+    elapsed = time.perf_counter() - started
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'req_per_sec': requests / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+    }
+
+def run(base_url: str = "http://localhost:8000", levels: List[int] = (1, 4, 16, 64),
+        requests_per_level: int = 500) -> Dict[str, List[Dict[str, Any]]]:
+    """Return {endpoint: [result per concurrency level]}"""
+    base_url = base_url.rstrip('/')
+    with urllib.request.urlopen(f"{base_url}/trades?limit=1", timeout=60) as resp:
+        sample = json.loads(resp.read())
+    if not sample:
+        raise RuntimeError("trades table is empty; seed it with smart_data_generator first")
+
+    endpoints = {
+        '/trades': f"{base_url}/trades?limit=100",
+        '/trades/{trade_id}': f"{base_url}/trades/{sample[0]['trade_id']}",
+        '/stats/summary': f"{base_url}/stats/summary",
+    }
+    results = {}
+    for name, url in endpoints.items():
+        _load(url, 4, 20)  # warm the pool and caches
+        results[name] = [_load(url, level, requests_per_level) for level in levels]
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--levels", default="1,4,16,64", help="comma-separated client concurrency levels")
+    parser.add_argument("--requests", type=int, default=500, help="requests per level")
+    args = parser.parse_args()
+
+    results = run(args.url, [int(x) for x in args.levels.split(',')], args.requests)
+    print(f"{'endpoint':<22}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, rows in results.items():
+        for r in rows:
+            print(f"{name:<22}{r['concurrency']:>6}{r['req_per_sec']:>10.1f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}")
@@ -0,0 +1,121 @@
+# benchmarks/bench_predict.py
+"""Compare single-row vs. batched failure scoring throughput.
+
+In-process (model.predict_proba directly):
+
+    python -m benchmarks.bench_predict --rows 2000
+
+--engines compares sklearn against the compiled forest (forest.py) per batch size.
+
+Add --url to also drive a running API's /predict-failure and /predict-failure/batch.
+"""
+import argparse
+import json
+import os
+import time
+import urllib.request
+from typing import Any, Dict, Optional
+
+import joblib
+import numpy as np
+
+from forest import load_model
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'failure_predictor.pkl')
+
+def _sample_features(n_rows: int, n_features: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0, 5000, size=(n_rows, n_features))
+
+def run_in_process(n_rows: int = 2000, batch_size: int = 1000) -> Dict[str, Any]:
+    """Rows/sec for one predict_proba per row vs. one per batch"""
+    model = joblib.load(MODEL_PATH)
+    X = _sample_features(n_rows, model.n_features_in_)
+
+    single_rows = min(n_rows, 200)  # per-row calls are slow; a sample is enough
+    started = time.perf_counter()
+    for i in range(single_rows):
+        model.predict_proba(X[i:i + 1])
+    single = single_rows / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for start in range(0, n_rows, batch_size):
+        model.predict_proba(X[start:start + batch_size])
+    batched = n_rows / (time.perf_counter() - started)
+
+    return {'single_rows_per_sec': single, 'batch_rows_per_sec': batched,
+            'batch_size': batch_size, 'speedup': batched / single}
+
+def run_engines(sizes=(1, 100, 1000, 10000)) -> Dict[int, Dict[str, float]]:
+    """Latency (ms per call) of sklearn vs. the compiled forest, which must agree exactly"""
+    model = joblib.load(MODEL_PATH)
+    forest = load_model(MODEL_PATH)
+    results = {}
+    for n in sizes:
+        X = _sample_features(n, model.n_features_in_)
+        if not np.array_equal(model.predict_proba(X), forest.predict_proba(X)):
+            raise AssertionError(f"compiled forest disagrees with sklearn at {n} rows")
+        reps = max(3, min(200, 2000 // n))
+        timings = {}
+        for name, engine in (('sklearn', model), ('forest', forest)):
+            started = time.perf_counter()
+            for _ in range(reps):
+                engine.predict_proba(X)
+            timings[name] = 1000 * (time.perf_counter() - started) / reps
+        timings['speedup'] = timings['sklearn'] / timings['forest']
+        results[n] = timings
+    return results
+
+def _post(url: str, payload) -> Any:
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=120) as resp:
+        return json.loads(resp.read())
+
+def run_http(base_url: str, n_rows: int = 2000, batch_size: int = 1000) -> Dict[str, Any]:
+    """Rows/sec through /predict-failure (one row per call) vs. /predict-failure/batch"""
+    base_url = base_url.rstrip('/')
+    rng = np.random.default_rng(0)
+    trades = [
+        {'quantity': float(q), 'price': float(p), 'is_margin_trade': bool(m)}
+        for q, p, m in zip(rng.integers(1, 5000, n_rows), rng.uniform(5, 3000, n_rows),
+                           rng.random(n_rows) < 0.25)
+    ]
+
+    single_rows = min(n_rows, 200)
+    started = time.perf_counter()
+    for trade in trades[:single_rows]:
+        _post(f"{base_url}/predict-failure", trade)
+    single = single_rows / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for start in range(0, n_rows, batch_size):
+        _post(f"{base_url}/predict-failure/batch", trades[start:start + batch_size])
+    batched = n_rows / (time.perf_counter() - started)
+
+    return {'single_rows_per_sec': single, 'batch_rows_per_sec': batched,
+            'batch_size': batch_size, 'speedup': batched / single}
+
+def run(n_rows: int = 2000, batch_size: int = 1000, base_url: Optional[str] = None) -> Dict[str, Any]:
+    results = {'in_process': run_in_process(n_rows, batch_size)}
+    if base_url:
+        results['http'] = run_http(base_url, n_rows, batch_size)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--url", default=None, help="base URL of a running API, e.g. http://localhost:8000")
+    parser.add_argument("--engines", action="store_true", help="compare sklearn vs. the compiled forest")
+    args = parser.parse_args()
+
+    if args.engines:
+        for n, r in run_engines().items():
+            print(f"{n:>6} rows  sklearn: {r['sklearn']:>8.2f} ms   forest: {r['forest']:>8.2f} ms   "
+                  f"speedup: {r['speedup']:.1f}x")
+
+    for mode, r in run(args.rows, args.batch_size, args.url).items():
+        print(f"{mode:<11} single: {r['single_rows_per_sec']:>10,.0f} rows/s   "
+              f"batch({r['batch_size']}): {r['batch_rows_per_sec']:>10,.0f} rows/s   "
+              f"speedup: {r['speedup']:.0f}x")
@@ -0,0 +1,90 @@
+# benchmarks/bench_startup.py
+"""Cold-start cost of each entry point: import time, first request and peak RSS.
+
+    python -m benchmarks.bench_startup              # median of 5 cold starts
+    python -m benchmarks.bench_startup --runs 10
+
+Every start runs in a freshly spawned process, so nothing is already
+imported or paged in. Entry points that need the database are skipped when
+DATABASE_URL is not set.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+from typing import Any, Callable, Dict, Tuple
+
+def _api() -> Tuple[float, float]:
+    started = time.perf_counter()
+    from fastapi.testclient import TestClient
+
+    import api
+    imported = time.perf_counter()
+    with TestClient(api.app) as client:
+        client.get("/health")
+        client.post("/predict-failure", json={'quantity': 100, 'price': 150, 'is_margin_trade': False})
+    return imported - started, time.perf_counter() - imported
+
+def _dashboard() -> Tuple[float, float]:
+    # AppTest imports streamlit; the script itself is the "first request"
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    imported = time.perf_counter()
+    AppTest.from_file("dashboard.py", default_timeout=120).run()
+    return imported - started, time.perf_counter() - imported
+
+def _trade_analysis() -> Tuple[float, float]:
+    started = time.perf_counter()
+    from trade_analysis import TradeAnalyzer
+    imported = time.perf_counter()
+    TradeAnalyzer(mode='pushdown').basic_stats()
+    return imported - started, time.perf_counter() - imported
+
+def _model() -> Tuple[float, float]:
+    started = time.perf_counter()
+    import numpy as np
+
+    from features import load_model
+    model = load_model().warm()
+    imported = time.perf_counter()
+    model.predict_proba(np.ones((1, model.n_features_in_)))
+    return imported - started, time.perf_counter() - imported
+
+# entry point -> (start, needs the database)
+ENTRY_POINTS: Dict[str, Tuple[Callable[[], Tuple[float, float]], bool]] = {
+    'api': (_api, True),
+    'dashboard': (_dashboard, True),
+    'trade_analysis': (_trade_analysis, True),
+    'model': (_model, False),
+}
+
+def _measure(name: str) -> Dict[str, float]:
+    import_seconds, first_seconds = ENTRY_POINTS[name][0]()
+    return {
+        'import_seconds': import_seconds,
+        'first_request_seconds': first_seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def run(runs: int = 5) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for name, (_, needs_db) in ENTRY_POINTS.items():
+        if needs_db and not os.environ.get("DATABASE_URL"):
+            continue
+        samples = []
+        for _ in range(runs):
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                samples.append(pool.apply(_measure, (name,)))
+        results[name] = {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per entry point (median reported)")
+    args = parser.parse_args()
+    results = run(args.runs)
+    print(f"{'entry point':<16}{'import s':>10}{'first request s':>17}{'peak RSS MB':>13}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['import_seconds']:>10.3f}{r['first_request_seconds']:>17.3f}{r['peak_rss_mb']:>13.1f}")
@@ -0,0 +1,66 @@
+# benchmarks/bench_store.py
+"""Memory and load time of the compact trade store vs. a plain pd.read_sql of SELECT *.
+
+    python -m benchmarks.bench_store                    # current trades table
+    python -m benchmarks.bench_store --rows 1000000     # reseed first
+
+Each loader runs in a fresh process so peak RSS is its own.
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+import trade_store
+from benchmarks.bench_analyzer import reseed
+from db import connection
+from trade_analysis import WINDOW_SQL
+
+def _load_read_sql() -> pd.DataFrame:
+    with connection() as conn:
+        return pd.read_sql(f"SELECT * FROM trades WHERE {WINDOW_SQL}", conn)
+
+def _load_store() -> pd.DataFrame:
+    return trade_store.load_trades(WINDOW_SQL)
+
+LOADERS = {'read_sql': _load_read_sql, 'store': _load_store}
+
+def _measure(name: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    frame = LOADERS[name]()
+    seconds = time.perf_counter() - started
+    rows = len(frame)
+    frame_bytes = trade_store.memory_bytes(frame)
+    return {
+        'rows': rows,
+        'load_seconds': seconds,
+        'frame_mb': frame_bytes / 1e6,
+        'mb_per_million': frame_bytes / 1e6 / (rows / 1e6) if rows else 0.0,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def run(n_rows: Optional[int] = None, seed: int = 42) -> Dict[str, Dict[str, Any]]:
+    if n_rows:
+        reseed(n_rows, seed)
+    results = {}
+    for name in LOADERS:
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            results[name] = pool.apply(_measure, (name,))
+    results['store']['estimate_mb_per_million'] = trade_store.estimate_bytes(1_000_000) / 1e6
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=None, help="reseed the trades table with this many rows")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.seed)
+    print(f"{'loader':<10}{'rows':>12}{'load s':>9}{'frame MB':>10}{'MB/1M rows':>12}{'peak RSS MB':>13}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['rows']:>12,}{r['load_seconds']:>9.2f}{r['frame_mb']:>10.1f}"
+              f"{r['mb_per_million']:>12.1f}{r['peak_rss_mb']:>13.1f}")
+    print(f"store estimate: {results['store']['estimate_mb_per_million']:.1f} MB per million trades")
@@ -1,117 +1,119 @@
 import streamlit as st
-import os
-import pandas as pd
-import psycopg2
-import matplotlib.pyplot as plt
+
+import dashboard_data
 
 st.set_page_config(page_title="Trade Monitor", layout="wide")
 st.title("🚨Post-Trade Dashboard")
 
-@st.cache_resource
-def init_connection():
-    # return psycopg2.connect(
-    #     host="localhost",        # Changed from "localhost" to Docker service name
-    #     port=5435,            
-    #     dbname="trading_db",
-    #     user="trader",         # Changed from "jupyter" to "trader"
-    #     password="securepass123"  # Changed from "simplepass"
-    # )
-    return psycopg2.connect(os.environ["DATABASE_URL"])
-
-conn = init_connection()
-
-def get_high_risk_failures():
-    return pd.read_sql("""
-        SELECT trade_id, symbol, quantity, price, value_at_risk, failure_reason
-        FROM trades 
-        WHERE status = 'FAILED' AND value_at_risk > 1000
-        ORDER BY value_at_risk DESC
-    """, conn)
-
-def get_settlement_delays():
-    return pd.read_sql("""
-        SELECT 
-            symbol,
-            AVG(EXTRACT(DAY FROM (actual_settlement_date - settlement_date))) AS avg_delay_days
-        FROM trades
-        WHERE actual_settlement_date > settlement_date
-        GROUP BY symbol
-    """, conn)
+# Panel data comes from dashboard_data: TTL'd results shared by every session,
+# queried on pooled connections (db.py), independent panels loaded in parallel
+
+# Reruns only the decorated panel on its own widget changes (Streamlit >= 1.33);
+# on older versions the whole script reruns but every data panel is a cache hit
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda fn: fn)
 
 st.header("📉 High-Risk Failed Trades")
-failures = get_high_risk_failures()
-st.dataframe(failures)
+# Keyset pages: high_risk_keys[p] is the last (value_at_risk, trade_id) before page p, so every page costs the same
+st.session_state.setdefault('high_risk_keys', [None])
+st.session_state.setdefault('high_risk_page', 0)
+page = st.session_state.high_risk_page
+
+def _next_page(after):
+    st.session_state.high_risk_keys[page + 1:] = [after]
+    st.session_state.high_risk_page = page + 1
+
+def _previous_page():
+    st.session_state.high_risk_page = page - 1
+
+panels = dashboard_data.load({
+    'failures': ('high_risk_failures', st.session_state.high_risk_keys[page]),
+    'high_risk': ('high_risk_totals',),
+    'delays': ('settlement_delays',),
+    'pending_risk': ('pending_risk',),
+})
+failures, high_risk, delays = panels['failures'], panels['high_risk'], panels['delays']
+st.dataframe(failures['trades'])
+col1, col2, col3 = st.columns([1, 4, 1])
+col1.button("◀ Previous", on_click=_previous_page, disabled=page == 0)
+col2.caption(f"Page {page + 1}, {dashboard_data.HIGH_RISK_PAGE_ROWS} trades per page, worst first")
+col3.button("Next ▶", on_click=_next_page, args=(failures['next_after'],), disabled=failures['next_after'] is None)
+
+st.header("🎯 Pending Trades Most Likely to Fail")
+pending_risk = panels['pending_risk']
+if pending_risk['scoring']:
+    scoring = pending_risk['scoring']
+    st.caption(f"Precomputed by batch_scoring.py: trades up to id {scoring['checkpoint_id']:,} scored, "
+               f"last run {scoring['refreshed_at']:%Y-%m-%d %H:%M}")
+    st.dataframe(pending_risk['trades'])
+else:
+    st.info("No risk scores yet; run `python batch_scoring.py`")
 
 st.header("⏰ Settlement Delays by Symbol")
-delays = get_settlement_delays()
 st.bar_chart(delays.set_index("symbol"))
 
 st.header("📊 Summary Metrics")
 col1, col2, col3 = st.columns(3)
-col1.metric("Total Failed Trades", len(failures))
-col2.metric("Total Value at Risk", f"${failures['value_at_risk'].sum():,.2f}")
+col1.metric("Total Failed Trades", high_risk['failed_trades'])
+col2.metric("Total Value at Risk", f"${high_risk['value_at_risk']:,.2f}")
 col3.metric("Worst Symbol", delays.loc[delays['avg_delay_days'].idxmax()]['symbol'] if not delays.empty else "N/A")
 
-import joblib
+from features import build_features, load_model
 
 @st.cache_resource
-def load_model():
-    return joblib.load('failure_predictor.pkl')
-
-model = load_model()
-
-st.header("🤖 AI Failure Predictor")
-col1, col2, col3, col4 = st.columns(4)
-
-with col1:
-    quantity = st.number_input("Quantity", value=100.0, step=50.0)
-with col2:
-    price = st.number_input("Price", value=150.0, step=10.0)
-with col3:
-    trade_hour = st.slider("Trade Hour", 0, 23, 9)
-with col4:
-    trade_dow = st.slider("Day of Week", 0, 6, 0)
-
-# Collect user inputs
-quantity = st.number_input("Quantity", min_value=1.0, value=100.0)
-price = st.number_input("Price", min_value=1.0, value=150.0)
-trade_hour = st.slider("Trade Hour", 0, 23, 10)
-trade_dow = st.selectbox("Day of Week", [0,1,2,3,4,5,6])  # 0=Mon
-
-# New input for margin trade (binary)
-is_margin_trade = st.selectbox("Is Margin Trade?", [0, 1])
-
-# Match training feature order
-features = [[quantity, price, is_margin_trade, trade_hour, trade_dow]]
-
-# Prediction
-prediction_proba = model.predict_proba(features)[0][1]
-st.metric("Failure Probability", f"{prediction_proba:.2%}")
-
-st.metric("Failure Probability", f"{prediction_proba:.2%}")
-
-if prediction_proba > 0.7:
-    st.error("🚨 High failure risk! Consider manual review")
-elif prediction_proba > 0.3:
-    st.warning("⚠️ Moderate failure risk")
-else:
-    st.success("✅ Low failure risk")
-
-# Add to your dashboard.py
-from trade_analysis import TradeAnalyzer
+def get_model():
+    return load_model('failure_predictor.pkl').warm()
+
+model = get_model()
+
+@fragment
+def predictor_panel():
+    st.header("🤖 AI Failure Predictor")
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        quantity = st.number_input("Quantity", min_value=1.0, value=100.0, step=50.0)
+    with col2:
+        price = st.number_input("Price", min_value=1.0, value=150.0, step=10.0)
+    with col3:
+        is_margin_trade = st.selectbox("Is Margin Trade?", [False, True])
+    with col4:
+        value_at_risk = st.number_input("Value at Risk (0 = estimate)", min_value=0.0, value=0.0, step=10.0)
+
+    # Same feature pipeline the model was trained with (features.py)
+    features = build_features({
+        'quantity': [quantity],
+        'price': [price],
+        'is_margin_trade': [is_margin_trade],
+        'value_at_risk': [value_at_risk or None],
+    })
+
+    prediction_proba = model.predict_proba(features)[0][1]
+    st.metric("Failure Probability", f"{prediction_proba:.2%}")
+
+    if prediction_proba > 0.7:
+        st.error("🚨 High failure risk! Consider manual review")
+    elif prediction_proba > 0.3:
+        st.warning("⚠️ Moderate failure risk")
+    else:
+        st.success("✅ Low failure risk")
+
+predictor_panel()
 
 def show_advanced_analysis():
-    analyzer = TradeAnalyzer()
+    # Shared incremental TradeAnalyzer, refreshed at most once per TTL (dashboard_data.py)
+    analysis = dashboard_data.get('advanced_analysis')
     st.header("📊 Advanced Trade Analysis")
-    
+
     # Show basic stats
-    stats = analyzer.basic_stats()
+    stats = analysis['basic_stats']
     col1, col2, col3 = st.columns(3)
     col1.metric("Total Trades", stats['total_trades'])
     col2.metric("Failure Rate", f"{stats['failure_rate']:.2%}")
     col3.metric("Total VaR", f"${stats['total_value']:,.2f}")
-    
+
     # Show symbol analysis
     st.subheader("Failure Rates by Symbol")
-    symbol_analysis = analyzer.failure_analysis_by_symbol()
-    st.dataframe(symbol_analysis.head(10))
+    st.dataframe(analysis['by_symbol'])
+
+with st.expander("⏱️ Data layer: query time and cache hit rate per panel"):
+    st.dataframe(dashboard_data.stats())
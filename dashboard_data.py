@@ -0,0 +1,192 @@
+# dashboard_data.py
+"""Cached, concurrent data layer behind dashboard.py.
+
+Every panel is read through get(panel, *params). Results are cached per
+(panel, params) for the panel's TTL in one process-wide cache shared by all
+Streamlit sessions. Concurrent misses on the same key run the query only
+once. load() fetches independent panels in parallel on the db executor.
+stats() reports calls, cache hit rate and query time per panel; every
+miss is also recorded in metrics.py as query `dashboard_data.<panel>`.
+
+Cached values are shared between sessions; treat them as read-only.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+import batch_scoring
+import metrics
+import rollups
+from db import connection, get_executor
+
+HIGH_RISK_PAGE_ROWS = 100
+MAX_ENTRIES = 256
+
+# Worst failures first. {after} resumes after the last (value_at_risk, trade_id) of the previous page;
+# idx_trades_failed_var serves every page as a range scan, however deep. ORDER BY names trades.value_at_risk,
+# the indexed NUMERIC column, not the float8 output column of the same name
+HIGH_RISK_SQL = f"""
+    SELECT trade_id, symbol, quantity::float8, price::float8, value_at_risk::float8, failure_reason,
+           value_at_risk::text AS var_key
+    FROM trades
+    WHERE status = 'FAILED' AND value_at_risk > {rollups.HIGH_RISK_VAR}{{after}}
+    ORDER BY trades.value_at_risk DESC, trade_id
+    LIMIT %(limit)s
+"""
+HIGH_RISK_AFTER = (" AND value_at_risk <= %(var)s::numeric"
+                   " AND (value_at_risk < %(var)s::numeric OR trade_id > %(trade_id)s)")
+
+def _high_risk_failures(after: Optional[Tuple[str, str]] = None,
+                        page_size: int = HIGH_RISK_PAGE_ROWS) -> Dict[str, Any]:
+    """One page of the worst failures, and the `after` key of the next page (None on the last one)"""
+    params: Dict[str, Any] = {'limit': page_size}
+    if after:
+        params['var'], params['trade_id'] = after
+    with connection() as conn:
+        trades = pd.read_sql(HIGH_RISK_SQL.format(after=HIGH_RISK_AFTER if after else ''), conn, params=params)
+    # value_at_risk as text, so the key matches the NUMERIC column exactly
+    next_after = (trades['var_key'].iloc[-1], trades['trade_id'].iloc[-1]) if len(trades) == page_size else None
+    return {'trades': trades.drop(columns='var_key'), 'next_after': next_after}
+
+def _high_risk_totals() -> Dict[str, Any]:
+    with connection() as conn:
+        return rollups.high_risk_failure_totals(conn)
+
+def _settlement_delays() -> pd.DataFrame:
+    with connection() as conn:
+        return rollups.settlement_delays(conn)
+
+# idx_trades_pending_risk serves it without a scan (optimizing_db.py)
+PENDING_RISK_SQL = """
+    SELECT trade_id, symbol, quantity::float8, price::float8, value_at_risk::float8,
+           failure_probability, risk_level
+    FROM trades
+    WHERE status = 'PENDING' AND failure_probability IS NOT NULL
+    ORDER BY failure_probability DESC, trade_id
+    LIMIT %(limit)s
+"""
+
+def _pending_risk(limit: int = HIGH_RISK_PAGE_ROWS) -> Dict[str, Any]:
+    # Scores precomputed by batch_scoring.py; nothing is scored on demand here
+    with connection() as conn:
+        scoring = batch_scoring.status(conn)
+        if not scoring:
+            return {'scoring': scoring, 'trades': pd.DataFrame()}
+        trades = pd.read_sql(PENDING_RISK_SQL, conn, params={'limit': limit})
+    return {'scoring': scoring, 'trades': trades}
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+def _advanced_analysis() -> Dict[str, Any]:
+    global _analyzer
+    from trade_analysis import TradeAnalyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            _analyzer = TradeAnalyzer(mode='incremental')
+        else:
+            _analyzer.refresh()   # folds in only the trades created since the last load
+    return {'basic_stats': _analyzer.basic_stats(),
+            'by_symbol': _analyzer.failure_analysis_by_symbol().head(10)}
+
+# panel -> (loader, TTL seconds)
+PANELS: Dict[str, Tuple[Callable[..., Any], float]] = {
+    'high_risk_failures': (_high_risk_failures, 30.0),
+    'high_risk_totals': (_high_risk_totals, 30.0),
+    'settlement_delays': (_settlement_delays, 60.0),
+    'pending_risk': (_pending_risk, 60.0),
+    'advanced_analysis': (_advanced_analysis, 60.0),
+}
+
+class PanelCache:
+    """Thread-safe TTL cache keyed on (panel, params), with per-panel counters"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[tuple, Tuple[float, Any]] = {}   # key -> (expires_at, value)
+        self._inflight: Dict[tuple, Future] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _panel_stats(self, panel: str) -> Dict[str, float]:
+        # caller holds the lock
+        return self._stats.setdefault(panel, {'calls': 0, 'hits': 0, 'errors': 0,
+                                              'query_seconds': 0.0, 'last_query_seconds': 0.0})
+
+    def get(self, panel: str, params: tuple, load: Callable[..., Any], ttl: float) -> Any:
+        key = (panel, params)
+        with self._lock:
+            stats = self._panel_stats(panel)
+            stats['calls'] += 1
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                stats['hits'] += 1
+                return entry[1]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                stats['hits'] += 1   # shares the query another session already started
+        if not owner:
+            return future.result()
+
+        started = time.perf_counter()
+        try:
+            with metrics.db_query(f"dashboard_data.{panel}") as query:
+                value = query.returned(load(*params))
+        except BaseException as e:
+            with self._lock:
+                self._panel_stats(panel)['errors'] += 1
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._panel_stats(panel)
+            stats['query_seconds'] += elapsed
+            stats['last_query_seconds'] = elapsed
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]   # oldest first
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> pd.DataFrame:
+        with self._lock:
+            rows = {panel: dict(s) for panel, s in self._stats.items()}
+        frame = pd.DataFrame.from_dict(rows, orient='index',
+                                       columns=['calls', 'hits', 'errors', 'query_seconds', 'last_query_seconds'])
+        queries = frame['calls'] - frame['hits']
+        frame['hit_rate'] = (frame['hits'] / frame['calls']).round(3)
+        frame['avg_query_ms'] = (1000 * frame['query_seconds'] / queries.where(queries > 0)).round(1)
+        frame['last_query_ms'] = (1000 * frame['last_query_seconds']).round(1)
+        return frame[['calls', 'hits', 'hit_rate', 'avg_query_ms', 'last_query_ms', 'errors']]
+
+_cache = PanelCache()
+
+def get(panel: str, *params) -> Any:
+    """Panel data for `params`, from the cache while it is younger than the panel's TTL"""
+    load, ttl = PANELS[panel]
+    return _cache.get(panel, params, load, ttl)
+
+def load(requests: Dict[str, tuple]) -> Dict[str, Any]:
+    """Fetch several panels concurrently: {name: (panel, *params)} -> {name: data}"""
+    futures = {name: get_executor().submit(get, *request) for name, request in requests.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+def stats() -> pd.DataFrame:
+    """Per-panel calls, cache hit rate and query time (ms)"""
+    return _cache.stats()
+
+def clear():
+    _cache.clear()
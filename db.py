@@ -0,0 +1,256 @@
+# db.py
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+import metrics
+
+# Single place that knows how to reach the database
+def get_db_connection():
+    return psycopg2.connect(os.environ["DATABASE_URL"])
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the checkout timeout"""
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool with health checks and recycling.
+
+    Connections are opened lazily up to `maxconn`; callers beyond that wait
+    up to `timeout` seconds. On checkout, connections older than
+    `max_lifetime` are recycled and ones idle longer than `check_after` are
+    pinged with SELECT 1. Idle connections above `minconn` are closed after
+    `max_idle` seconds.
+    """
+
+    def __init__(self, minconn: int = 1, maxconn: int = 10, timeout: float = 10.0,
+                 max_lifetime: float = 1800.0, max_idle: float = 300.0,
+                 check_after: float = 30.0, connect=get_db_connection):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = []      # [(conn, last_used)], most recently used last
+        self._born = {}      # conn -> created_at
+        self._size = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_seconds': 0.0,
+            'created': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+        }
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._born[conn] = time.monotonic()
+            self._stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._born.pop(conn, None)
+            self._size -= 1
+            self._cond.notify()
+
+    def _prune_idle(self, now):
+        # caller holds the lock
+        while self._size > self.minconn and self._idle and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.pop(0)
+            self._born.pop(conn, None)
+            self._size -= 1
+            self._stats['recycled'] += 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _healthy(self, conn, last_used, now) -> bool:
+        if conn.closed:
+            return False
+        if now - self._born.get(conn, now) > self.max_lifetime:
+            with self._cond:
+                self._stats['recycled'] += 1
+            return False
+        if now - last_used > self.check_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                return False
+        return True
+
+    def getconn(self):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                self._prune_idle(now)
+                entry = None
+                if self._idle:
+                    entry = self._idle.pop()
+                elif self._size < self.maxconn:
+                    self._size += 1
+                else:
+                    if not waited:
+                        waited = True
+                        self._stats['waits'] += 1
+                    remaining = deadline - now
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        if not self._idle and self._size >= self.maxconn:
+                            self._stats['timeouts'] += 1
+                            self._stats['wait_seconds'] += time.monotonic() - started
+                            raise PoolTimeout(f"No database connection available within {self.timeout}s")
+                    continue
+
+            if entry is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                conn, last_used = entry
+                if not self._healthy(conn, last_used, time.monotonic()):
+                    self._discard(conn)
+                    continue
+
+            with self._cond:
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['wait_seconds'] += time.monotonic() - started
+            return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if not discard and not conn.closed:
+            try:
+                status = conn.get_transaction_status()
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a `with` block"""
+        conn = self.getconn()
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool counters and current occupancy"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+            })
+        return stats
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            for conn, _ in idle:
+                self._born.pop(conn, None)
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._cond.notify_all()
+
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+
+def get_pool() -> ConnectionPool:
+    """Process-wide pool, sized from DB_POOL_MIN / DB_POOL_MAX / DB_POOL_TIMEOUT"""
+    global _pool, _pool_pid
+    # Connections must not cross a fork, so each worker process gets its own pool
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(
+                    minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+                    maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+                    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+def connection():
+    """Borrow a connection from the shared pool: `with connection() as conn: ...`"""
+    return get_pool().connection()
+
+def get_executor() -> ThreadPoolExecutor:
+    """Thread pool for blocking DB work, sized to the connection pool so threads never queue on it"""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _pool_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("DB_POOL_MAX", 10)),
+                    thread_name_prefix="db",
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+def _call_with_connection(fn, args, kwargs):
+    # Timed as module.function, e.g. api.fetch_trades; pool checkout is not included
+    with connection() as conn, metrics.db_query(f"{fn.__module__}.{fn.__name__.lstrip('_')}") as query:
+        return query.returned(fn(conn, *args, **kwargs))
+
+async def run_db(fn, *args, **kwargs):
+    """Run blocking `fn(conn, *args, **kwargs)` on a pooled connection off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(_call_with_connection, fn, args, kwargs)
+    )
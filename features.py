@@ -0,0 +1,90 @@
+# features.py
+"""Single feature pipeline for the failure predictor.
+
+Training (Untitled.ipynb), the API, the dashboard and batch scoring all build
+the model's input matrix here, so they cannot drift apart. Bump
+FEATURE_SCHEMA_VERSION whenever FEATURE_NAMES or their derivation changes and
+retrain; models carry the schema they were trained with and load_model()
+refuses one that does not match.
+"""
+from typing import Any, Dict, Iterable, Mapping
+
+import numpy as np
+
+import forest
+
+FEATURE_SCHEMA_VERSION = 1
+FEATURE_NAMES = ['quantity', 'price', 'is_margin_trade', 'value_at_risk', 'trade_value']
+FEATURE_SCHEMA = {'version': FEATURE_SCHEMA_VERSION, 'features': FEATURE_NAMES}
+
+# Raw trade fields the features are derived from
+INPUT_FIELDS = ['quantity', 'price', 'is_margin_trade', 'value_at_risk']
+
+# value_at_risk is booked as 0.1%-1% of notional; inputs without one get the midpoint
+DEFAULT_VAR_RATE = 0.0055
+
+# Failure probability above which a trade is HIGH / MEDIUM risk
+HIGH_RISK_PROBABILITY = 0.7
+MEDIUM_RISK_PROBABILITY = 0.3
+
+class FeatureSchemaError(ValueError):
+    """Raised when a model was trained on a different feature schema"""
+
+def _column(cols: Mapping[str, Any], name: str, n: int) -> np.ndarray:
+    if name not in cols:
+        return np.full(n, np.nan)
+    return np.asarray(cols[name], dtype=np.float64)   # None -> NaN
+
+def build_features(cols: Mapping[str, Any]) -> np.ndarray:
+    """Model matrix (rows x FEATURE_NAMES) from column arrays: a dict of lists/arrays or a DataFrame"""
+    quantity = np.asarray(cols['quantity'], dtype=np.float64)
+    price = np.asarray(cols['price'], dtype=np.float64)
+    n = len(quantity)
+    if len(price) != n:
+        raise ValueError("quantity and price must have the same length")
+    if np.isnan(quantity).any() or np.isnan(price).any():
+        raise ValueError("quantity and price are required for every trade")
+
+    X = np.empty((n, len(FEATURE_NAMES)))
+    X[:, 0] = quantity
+    X[:, 1] = price
+    X[:, 4] = quantity * price
+
+    margin = _column(cols, 'is_margin_trade', n)
+    X[:, 2] = np.where(np.isnan(margin), 0.0, margin != 0)
+
+    var = _column(cols, 'value_at_risk', n)
+    X[:, 3] = np.where(np.isnan(var), X[:, 4] * DEFAULT_VAR_RATE, var)
+    return X
+
+def features_from_records(records: Iterable[Mapping[str, Any]]) -> np.ndarray:
+    """Model matrix from dict-like trade rows (JSON objects, API requests)"""
+    records = list(records)
+    return build_features({f: [r.get(f) for r in records] for f in INPUT_FIELDS})
+
+def risk_levels(probabilities) -> np.ndarray:
+    """HIGH / MEDIUM / LOW label for each failure probability"""
+    probabilities = np.asarray(probabilities)
+    return np.where(probabilities > HIGH_RISK_PROBABILITY, "HIGH",
+                    np.where(probabilities > MEDIUM_RISK_PROBABILITY, "MEDIUM", "LOW"))
+
+def model_schema(model) -> Dict[str, Any]:
+    """Feature schema recorded on a compiled forest or a fitted sklearn model"""
+    meta = getattr(model, 'meta', None)
+    if meta is not None:
+        return meta.get('feature_schema')
+    return getattr(model, 'feature_schema_', None)
+
+def check_schema(model):
+    schema = model_schema(model)
+    if schema is None:
+        raise FeatureSchemaError("Model carries no feature schema; re-export it with `python forest.py`")
+    if schema.get('version') != FEATURE_SCHEMA_VERSION or list(schema.get('features', [])) != FEATURE_NAMES:
+        raise FeatureSchemaError(
+            f"Model expects feature schema v{schema.get('version')} {schema.get('features')}, "
+            f"pipeline builds v{FEATURE_SCHEMA_VERSION} {FEATURE_NAMES}"
+        )
+
+def load_model(model_path: str = forest.DEFAULT_MODEL_PATH) -> forest.CompiledForest:
+    """Compiled failure predictor, verified against this pipeline's feature schema"""
+    return forest.load_model(model_path, check=check_schema)
@@ -0,0 +1,267 @@
+# forest.py
+"""Array-backed evaluator for the trained RandomForest (failure_predictor.pkl).
+
+The forest is exported as plain .npy arrays that load with mmap, so every
+worker on a host shares the same pages and loading takes milliseconds,
+with no scikit-learn import.
+
+Scoring uses the QuickScorer layout: for each feature, the forest's split
+thresholds are sorted once and every (threshold bin, tree) pair stores a
+bitmask of the leaves still reachable. A row is binned with one
+searchsorted per feature; AND-ing its masks gives each tree's exit leaf as
+the lowest set bit. There is no per-node traversal, and probabilities
+match sklearn's predict_proba exactly.
+
+    python forest.py [failure_predictor.pkl] [failure_predictor.forest]
+"""
+import json
+import os
+import shutil
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'failure_predictor.pkl')
+
+# Rows scored per vectorized pass; keeps the (rows, trees, words) masks cache-sized
+CHUNK_ROWS = 1024
+
+# Leaf bitmasks are stored as uint32 words; gathering narrower words measured
+# markedly faster than uint64 for this forest's ~60-90 leaves per tree
+WORD_BITS = 32
+
+class CompiledForest:
+    """Drop-in replacement for RandomForestClassifier.predict_proba"""
+
+    def __init__(self, thresholds: List[np.ndarray], masks: List[np.ndarray],
+                 leaf_value: np.ndarray, leaf_base: np.ndarray, meta: Dict[str, Any]):
+        self.thresholds = thresholds    # per feature: sorted float32 split thresholds
+        self.masks = masks              # per feature: (len(thresholds) + 1, n_trees, words) uint32
+        self.leaf_value = leaf_value    # (n_classes, n_leaves) class fractions per leaf
+        self.leaf_base = leaf_base      # first leaf_value row of each tree
+        self.meta = meta
+        self.n_features_in_ = meta['n_features']
+        self.n_trees = meta['n_trees']
+        self.classes_ = np.array(meta['classes'])
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Exit leaf (column of leaf_value) of every tree, shape (n_trees, n_rows)"""
+        # sklearn scores float32 inputs; thresholds were rounded down to float32
+        # at export, so x <= t32 is exactly sklearn's x <= t64 test
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[-1]} features, but the forest expects {self.n_features_in_}")
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN or infinity")
+
+        alive = None
+        for k in range(self.n_features_in_):
+            bins = np.searchsorted(self.thresholds[k], X[:, k], side='left')
+            if alive is None:
+                alive = np.take(self.masks[k], bins, axis=0)
+            else:
+                np.bitwise_and(alive, np.take(self.masks[k], bins, axis=0), out=alive)
+
+        # The exit leaf is the lowest set bit of the first non-zero mask word
+        leaf = np.zeros(alive.shape[:2], dtype=np.int64)
+        word = np.zeros(alive.shape[:2], dtype=np.int64)
+        for w in range(alive.shape[2] - 1, -1, -1):
+            nonzero = alive[:, :, w] != 0
+            word = np.where(nonzero, alive[:, :, w], word)
+            leaf = np.where(nonzero, WORD_BITS * w, leaf)
+        lowest = (word & -word).astype(np.float64)
+        # float64 exponent of a power of two is its bit index
+        leaf += (lowest.view(np.int64) >> 52) - 1023
+        return (leaf + self.leaf_base).T
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X)
+        proba = np.empty((len(X), len(self.classes_)))
+        for start in range(0, len(X), CHUNK_ROWS):
+            leaf = self.apply(X[start:start + CHUNK_ROWS])
+            for c in range(len(self.classes_)):
+                leaf_values = np.take(self.leaf_value[c], leaf)   # (trees, rows)
+                # cumsum adds tree by tree in sklearn's order (a plain sum
+                # would pairwise-reduce and differ in the last bit)
+                proba[start:start + CHUNK_ROWS, c] = np.cumsum(leaf_values, axis=0)[-1]
+        proba /= self.n_trees
+        return proba
+
+    def warm(self) -> 'CompiledForest':
+        """Fault every mmap'd page in and run one prediction, so the first request pays neither"""
+        for array in [*self.thresholds, *self.masks, self.leaf_value, self.leaf_base]:
+            np.asarray(array).view(np.uint8).sum()
+        self.predict_proba(np.zeros((1, self.n_features_in_)))
+        return self
+
+def _float32_floor(values: np.ndarray) -> np.ndarray:
+    """Largest float32 <= each float64 value"""
+    rounded = values.astype(np.float32)
+    over = rounded.astype(np.float64) > values
+    rounded[over] = np.nextafter(rounded[over], np.float32(-np.inf))
+    return rounded
+
+def compile_forest(model, feature_schema: Optional[Dict[str, Any]] = None) -> CompiledForest:
+    """Export a fitted sklearn RandomForestClassifier to QuickScorer arrays.
+
+    The feature schema is taken from the model's `feature_schema_` (set at
+    training time) or from `feature_schema`, which must name the same
+    columns the model was fitted on.
+    """
+    feature_names = [str(f) for f in getattr(model, 'feature_names_in_', [])]
+    feature_schema = getattr(model, 'feature_schema_', None) or feature_schema
+    if feature_schema and feature_names and list(feature_schema['features']) != feature_names:
+        raise ValueError(f"Model was fitted on {feature_names}, not {feature_schema['features']}")
+
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    n_features = int(model.n_features_in_)
+    n_trees = len(trees)
+    words = max(-(-int((t.children_left == -1).sum()) // WORD_BITS) for t in trees)
+
+    # Sorted unique split thresholds per feature define the bins
+    split_thresholds = [[] for _ in range(n_features)]
+    for tree in trees:
+        split = tree.children_left != -1
+        for k in range(n_features):
+            split_thresholds[k].append(_float32_floor(tree.threshold[split & (tree.feature == k)]))
+    thresholds = [np.unique(np.concatenate(t)) for t in split_thresholds]
+
+    # masks[k][b, t] starts all-ones; a split on feature k at threshold rank r
+    # clears its left-subtree leaves for every bin b > r (x > threshold)
+    full = 2 ** WORD_BITS - 1
+    events = [np.full((len(thresholds[k]) + 1, n_trees, words), full, dtype=np.uint32) for k in range(n_features)]
+    leaf_values, leaf_base = [], []
+    n_leaves = 0
+    for t, tree in enumerate(trees):
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+        split = ~is_leaf
+        if not np.all(tree.children_left[split] == nodes[split] + 1):
+            raise ValueError("Expected depth-first node order (left child == node + 1)")
+
+        # Depth-first order: the left subtree of node i is nodes [i + 1, right[i]),
+        # so its leaves are leaf positions [leaves_before[i + 1], leaves_before[right[i]])
+        leaves_before = np.concatenate([[0], np.cumsum(is_leaf)])
+        first = leaves_before[nodes[split] + 1]
+        last = leaves_before[tree.children_right[split]]
+        feature = tree.feature[split]
+        for k in range(n_features):
+            on_k = feature == k
+            if not on_k.any():
+                continue
+            rank = np.searchsorted(thresholds[k], _float32_floor(tree.threshold[split][on_k]))
+            for r, a, b in zip(rank.tolist(), first[on_k].tolist(), last[on_k].tolist()):
+                for w in range(words):
+                    lo, hi = max(a - WORD_BITS * w, 0), min(b - WORD_BITS * w, WORD_BITS)
+                    if lo < hi:
+                        bits = ((1 << hi) - 1) ^ ((1 << lo) - 1)
+                        events[k][r + 1, t, w] &= np.uint32(~bits & full)
+
+        counts = tree.value[is_leaf, 0, :]
+        leaf_values.append(counts / counts.sum(axis=1, keepdims=True))
+        leaf_base.append(n_leaves)
+        n_leaves += int(is_leaf.sum())
+
+    masks = [np.bitwise_and.accumulate(e, axis=0) for e in events]
+    meta = {
+        'n_features': n_features,
+        'n_trees': n_trees,
+        'n_leaves': n_leaves,
+        'words': words,
+        'classes': [int(c) for c in model.classes_],
+        'feature_names': feature_names,
+        'feature_schema': feature_schema,
+    }
+    return CompiledForest(thresholds, masks, np.ascontiguousarray(np.concatenate(leaf_values).T),
+                          np.array(leaf_base, dtype=np.int64), meta)
+
+def save_forest(forest: CompiledForest, path: str):
+    """Write the arrays to a temporary directory and move it into place in one rename"""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for k in range(forest.n_features_in_):
+        np.save(os.path.join(tmp, f"thresholds_{k}.npy"), forest.thresholds[k])
+        np.save(os.path.join(tmp, f"masks_{k}.npy"), forest.masks[k])
+    np.save(os.path.join(tmp, "leaf_value.npy"), forest.leaf_value)
+    np.save(os.path.join(tmp, "leaf_base.npy"), forest.leaf_base)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(forest.meta, f, indent=2)
+    if os.path.exists(path):
+        # Readers that already mapped the old arrays keep them until they reload
+        stale = f"{path}.old-{os.getpid()}"
+        os.rename(path, stale)
+        os.rename(tmp, path)
+        shutil.rmtree(stale, ignore_errors=True)
+    else:
+        os.rename(tmp, path)
+
+def load_forest(path: str, mmap: bool = True) -> CompiledForest:
+    """Load a saved forest; with mmap the arrays are shared through the page cache"""
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+    load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+    n = meta['n_features']
+    return CompiledForest(
+        [load(f"thresholds_{k}") for k in range(n)],
+        [load(f"masks_{k}") for k in range(n)],
+        load("leaf_value"),
+        load("leaf_base"),
+        meta,
+    )
+
+def compiled_path(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + '.forest'
+
+def load_model(model_path: str = DEFAULT_MODEL_PATH,
+               check: Optional[Callable[['CompiledForest'], None]] = None) -> CompiledForest:
+    """Compiled forest for `model_path`, compiling from the pickle only if no fresh export exists.
+
+    The export carries only the schema the pickle was trained with
+    (`feature_schema_`); stamping one onto an older pickle is left to
+    `python forest.py`. `check` raises ValueError for an unusable model: a
+    fresh export that fails it is recompiled, and a compiled forest that
+    fails it is never saved.
+    """
+    path = compiled_path(model_path)
+    meta_path = os.path.join(path, 'meta.json')
+    if os.path.exists(meta_path) and (
+        not os.path.exists(model_path) or os.path.getmtime(meta_path) >= os.path.getmtime(model_path)
+    ):
+        forest = load_forest(path)
+        try:
+            if check:
+                check(forest)
+            return forest
+        except ValueError:
+            if not os.path.exists(model_path):
+                raise
+
+    # No usable export: compile once and save it, so every later worker on this host mmaps it
+    import joblib  # sklearn is only needed when there is no compiled export
+    forest = compile_forest(joblib.load(model_path))
+    if check:
+        check(forest)
+    try:
+        save_forest(forest, path)
+    except OSError:
+        return forest   # read-only checkout, or another worker just saved it
+    return load_forest(path)
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL_PATH
+    target = sys.argv[2] if len(sys.argv) > 2 else compiled_path(source)
+
+    import joblib
+    from features import FEATURE_SCHEMA
+    model = joblib.load(source)
+    if getattr(model, 'feature_schema_', None) is None:
+        print(f"⚠️  {source} carries no feature schema; stamping v{FEATURE_SCHEMA['version']} {FEATURE_SCHEMA['features']}")
+    forest = compile_forest(model, FEATURE_SCHEMA)
+    save_forest(forest, target)
+    print(f"✅ Compiled {forest.n_trees} trees ({forest.meta['n_leaves']:,} leaves) to {target}")
+
+    X = np.random.default_rng(0).uniform(0, 5000, size=(1000, forest.n_features_in_))
+    diff = np.abs(model.predict_proba(X) - load_forest(target).predict_proba(X)).max()
+    print(f"🔍 Max |Δ probability| vs sklearn on 1,000 random rows: {diff:.2e}")
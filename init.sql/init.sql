@@ -0,0 +1,22 @@
+-- Schema for the trades table, run by the postgres containers on first start.
+-- Secondary indexes are left to `python optimizing_db.py --apply`.
+CREATE TABLE IF NOT EXISTS trades (
+    id SERIAL PRIMARY KEY,
+    trade_id VARCHAR(32) NOT NULL UNIQUE,
+    symbol VARCHAR(16) NOT NULL,
+    quantity INTEGER NOT NULL,
+    price NUMERIC(18, 6) NOT NULL,
+    trade_currency VARCHAR(8) NOT NULL,
+    trade_date TIMESTAMP NOT NULL,
+    settlement_date TIMESTAMP NOT NULL,
+    actual_settlement_date TIMESTAMP,
+    buyer_id VARCHAR(32) NOT NULL,
+    seller_id VARCHAR(32) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    failure_reason VARCHAR(64),
+    value_at_risk NUMERIC(18, 6),
+    is_margin_trade BOOLEAN NOT NULL DEFAULT false,
+    failure_probability REAL,           -- written by batch_scoring.py
+    risk_level VARCHAR(8),
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
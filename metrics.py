@@ -0,0 +1,246 @@
+# metrics.py
+"""In-process latency and throughput metrics in the Prometheus text format.
+
+Counters, gauges and histograms live in one process-wide registry, and
+render() returns them in the Prometheus exposition format. The API serves
+that as GET /metrics. Each process keeps its own registry, so with several
+uvicorn workers each worker must be scraped.
+
+Recording a value costs a dict lookup, a bisect and a few additions under a
+lock, about a microsecond, so instrumentation stays on in production.
+
+Slow-query log: when SLOW_QUERY_MS is set, every db_query() that takes at
+least that long is logged as a warning on the `slow_query` logger.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = tuple(float(4 ** i) for i in range(9))             # 1 .. 65536 rows
+BYTE_BUCKETS = tuple(float(256 * 4 ** i) for i in range(10))     # 256B .. 64MB
+
+_slow_query_ms = os.environ.get("SLOW_QUERY_MS")
+SLOW_QUERY_SECONDS: Optional[float] = float(_slow_query_ms) / 1000 if _slow_query_ms else None
+slow_query_log = logging.getLogger("slow_query")
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return '\n'.join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()])
+
+class Counter(_Metric):
+    """Monotonically increasing total, e.g. rows fetched"""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+class Gauge(Counter):
+    """Value that is set rather than accumulated, e.g. connections in use"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class _Timer(ContextDecorator):
+    def __init__(self, histogram: 'Histogram', labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets (upper bounds, inclusive)"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (last one is +Inf), sum, count]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        """Record the duration of a `with` block, or of every call when used as a decorator"""
+        return _Timer(self, labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, n in zip([*map(_format_value, self.buckets), '+Inf'], counts):
+                cumulative += n
+                le = 'le="' + bound + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+def _register(cls, name: str, *args, **kwargs):
+    # Get-or-create, so a module that is imported twice shares its metrics
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        return metric
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(Counter, name, help, labelnames)
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge, name, help, labelnames)
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help, labelnames, buckets)
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    return ''.join(metric.render() + '\n' for metric in metrics)
+
+# Metrics shared by the API, the analyzer and the dashboard data layer
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_seconds", "Time from request to the last response byte", ("method", "route", "status"))
+HTTP_RESPONSE_BYTES = histogram(
+    "http_response_bytes", "Response body size", ("route",), buckets=BYTE_BUCKETS)
+DB_QUERY_SECONDS = histogram("db_query_seconds", "Database query time by query name", ("query",))
+DB_ROWS = counter("db_rows_total", "Rows returned by database queries", ("query",))
+DB_QUERY_ERRORS = counter("db_query_errors_total", "Database queries that raised", ("query",))
+DB_POOL_CONNECTIONS = gauge("db_pool_connections", "Pooled database connections by state", ("state",))
+SERIALIZE_SECONDS = histogram("serialize_seconds", "Time spent encoding response rows", ("format",))
+MODEL_PREDICT_SECONDS = histogram("model_predict_seconds", "predict_proba time per call")
+MODEL_BATCH_ROWS = histogram("model_batch_rows", "Rows scored per predict_proba call", buckets=ROW_BUCKETS)
+ANALYZER_STEP_SECONDS = histogram("analyzer_step_seconds", "TradeAnalyzer step time", ("mode", "step"))
+
+class _QueryTimer:
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+
+    def returned(self, result: Any) -> Any:
+        """Count the rows in `result` (a fetchall list, DataFrame or single row) and pass it through"""
+        if result is None:
+            self.rows = 0
+        elif isinstance(result, list) or hasattr(result, 'shape'):
+            self.rows = len(result)
+        else:
+            self.rows = 1
+        return result
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        DB_QUERY_SECONDS.observe(elapsed, query=self.name)
+        if exc_type is not None:
+            DB_QUERY_ERRORS.inc(query=self.name)
+        else:
+            DB_ROWS.inc(self.rows, query=self.name)
+        if SLOW_QUERY_SECONDS is not None and elapsed >= SLOW_QUERY_SECONDS:
+            slow_query_log.warning("Slow query %s: %.1fms, %d rows%s", self.name, elapsed * 1000, self.rows,
+                                   f" ({exc_type.__name__})" if exc_type else "")
+        return False
+
+def db_query(name: str) -> _QueryTimer:
+    """Time a query as `name`: `with db_query('x') as q: rows = q.returned(cur.fetchall())`"""
+    return _QueryTimer(name)
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and response bytes per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        response = {'status': 500, 'bytes': 0}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['bytes'] += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by route template (/trades/{trade_id}), never by raw path
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope['method'],
+                                         route=route, status=response['status'])
+            HTTP_RESPONSE_BYTES.observe(response['bytes'], route=route)
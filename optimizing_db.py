@@ -1,23 +1,309 @@
-from api import get_db_connection
+# optimizing_db.py
+"""Workload-aware index and partition advisor for the trades table.
 
-def optimize_db():
+    python optimizing_db.py                    # evaluate candidates, change nothing
+    python optimizing_db.py --apply            # keep the indexes that speed up the workload
+    python optimizing_db.py --apply --drop-unused
+    python optimizing_db.py --partition        # print the monthly partitioning DDL
+    python optimizing_db.py --partition --apply
+
+workload() lists the queries api.py, dashboard.py, trade_analysis.py,
+batch_scoring.py and the refresh jobs issue against trades. Each candidate
+index is built inside a transaction, and the workload is re-run under EXPLAIN
+ANALYZE. The index is kept (with --apply) only if a query planned with it got
+at least MIN_GAIN faster; otherwise the transaction rolls back. Index builds
+block writes to trades while they run, so run the advisor off-peak.
+
+The workload is maintained by hand and may miss a query, so --drop-unused
+never drops an index that pg_stat_user_indexes shows was scanned since the
+statistics were last reset.
+"""
+import sys
+from datetime import date
+from typing import Any, Dict, List, Tuple
+
+from db import get_db_connection
+
+# name -> (definition, the query shape it is for)
+CANDIDATE_INDEXES: Dict[str, Tuple[str, str]] = {
+    'idx_trades_date_id': (
+        "ON trades(trade_date DESC, trade_id DESC)",
+        "GET /trades newest first, keyset pages",
+    ),
+    'idx_trades_symbol_date': (
+        "ON trades(symbol, trade_date DESC, trade_id DESC)",
+        "GET /trades?symbol= newest first",
+    ),
+    'idx_trades_status_date': (
+        "ON trades(status, trade_date DESC, trade_id DESC)",
+        "GET /trades?status= newest first",
+    ),
+    'idx_trades_failed_var': (
+        "ON trades(value_at_risk DESC) INCLUDE (trade_id, symbol, quantity, price, failure_reason) "
+        "WHERE status = 'FAILED'",
+        "dashboard high-risk failures, index-only top N",
+    ),
+    'idx_trades_pending_risk': (
+        "ON trades(failure_probability DESC, trade_id) WHERE status = 'PENDING' AND failure_probability IS NOT NULL",
+        "dashboard pending trades most likely to fail, top N",
+    ),
+    'idx_trades_window': (
+        "ON trades(trade_date) INCLUDE (symbol, status, value_at_risk, settlement_date, actual_settlement_date)",
+        "covering trade_date range scans (90-day window, per-day refreshes)",
+    ),
+    'idx_trades_created_at': (
+        "ON trades(created_at)",
+        "created_at watermark scans (incremental analyzer, rollups, snapshots)",
+    ),
+}
+
+# Written by batch_scoring.py, which adds the column on its first run
+SCORE_COLUMN = 'failure_probability'
+
+MIN_GAIN = 0.2      # a candidate must cut some query's latency by 20% to be kept
+RUNS = 3            # EXPLAIN ANALYZE runs per query; the fastest is reported
+
+def workload(has_scores: bool = True) -> List[Tuple[str, str]]:
+    """(label, SQL) for the query shapes the application issues, with representative parameters.
+
+    Without has_scores (trades has no batch_scoring.py columns yet) the queries reading them are left out.
+    """
+    import rollups
+    import trade_grain
+    from batch_scoring import SELECT_SQL as SCORING_SELECT
+    from dashboard_data import HIGH_RISK_AFTER, HIGH_RISK_SQL, PENDING_RISK_SQL
+    from trade_analysis import WINDOW_SQL
+    from trade_queries import TRADE_SELECT
+
+    newest = " ORDER BY trade_date DESC, trade_id DESC LIMIT 100"
+    one_day = "trade_date >= CURRENT_DATE - 7 AND trade_date < CURRENT_DATE - 6"
+    recent = "created_at > now() - INTERVAL '1 minute'"
+    queries = [
+        ("api /trades", TRADE_SELECT + newest),
+        ("api /trades?symbol", TRADE_SELECT + " WHERE symbol = 'AAPL'" + newest),
+        ("api /trades?status", TRADE_SELECT + " WHERE status = 'FAILED'" + newest),
+        ("api /trades?symbol&status", TRADE_SELECT + " WHERE symbol = 'AAPL' AND status = 'FAILED'" + newest),
+        ("api /trades keyset page", TRADE_SELECT
+         + " WHERE (trade_date, trade_id) < (CURRENT_DATE - 30, '')" + newest),
+        ("api /trades/{id}", TRADE_SELECT + " WHERE trade_id = 'T000000000000'"),
+        ("dashboard high-risk failures", HIGH_RISK_SQL.format(after='') % {'limit': 100}),
+        ("dashboard high-risk keyset page", HIGH_RISK_SQL.format(after=HIGH_RISK_AFTER)
+         % {'limit': 100, 'var': "'5000'", 'trade_id': "''"}),
+        ("batch scoring id range", SCORING_SELECT % (0, 50_000)),
+        ("batch scoring pending rescore", SCORING_SELECT % (0, 50_000) + " AND status = 'PENDING'"),
+        ("analyzer pushdown basic_stats",
+         "SELECT count(*), count(*) FILTER (WHERE status = 'FAILED'), sum(value_at_risk), "
+         f"min(trade_date), max(trade_date) FROM trades WHERE {WINDOW_SQL}"),
+        ("analyzer incremental refresh", trade_grain.grain_query(f"{WINDOW_SQL} AND {recent}")),
+        ("rollups changed days", f"SELECT DISTINCT trade_date::date FROM trades WHERE {recent}"),
+        ("rollups one day", rollups.ROLLUP_SELECT.format(where=one_day)),
+    ]
+    if has_scores:
+        queries.append(("dashboard pending risk", PENDING_RISK_SQL % {'limit': 100}))
+    return queries
+
+def _parents(cur) -> Dict[str, str]:
+    """Partition and partition-index names -> the trades table / index they belong to"""
+    cur.execute("""
+        SELECT c.relname, p.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.oid = 'trades'::regclass
+           OR p.oid IN (SELECT indexrelid FROM pg_index WHERE indrelid = 'trades'::regclass)
+    """)
+    return dict(cur.fetchall())
+
+def _plan_scans(node: Dict[str, Any], parents: Dict[str, str]) -> List[str]:
+    """'Seq Scan', 'Index Scan idx_x', ... for every scan on trades in a JSON plan, once each"""
+    scans = []
+    relation = parents.get(node.get('Relation Name'), node.get('Relation Name'))
+    if relation == 'trades' or node.get('Index Name'):
+        index = parents.get(node.get('Index Name'), node.get('Index Name'))
+        scans.append(f"{node['Node Type']} {index}" if index else node['Node Type'])
+    for child in node.get('Plans', []):
+        scans.extend(_plan_scans(child, parents))
+    return list(dict.fromkeys(scans))
+
+def _measure(cur, sql: str, runs: int = RUNS) -> Dict[str, Any]:
+    best = None
+    for _ in range(runs):
+        cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql)
+        plan = cur.fetchone()[0][0]
+        if best is None or plan['Execution Time'] < best['Execution Time']:
+            best = plan
+    return {'ms': best['Execution Time'], 'scans': _plan_scans(best['Plan'], _parents(cur))}
+
+def _uses(cur, sql: str, index: str) -> bool:
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql)
+    plan = cur.fetchone()[0][0]['Plan']
+    return any(scan.endswith(' ' + index) for scan in _plan_scans(plan, _parents(cur)))
+
+def _trade_indexes(cur) -> Dict[str, bool]:
+    """Index name -> whether it backs a constraint (primary key / unique)"""
+    cur.execute("""
+        SELECT i.relname, c.oid IS NOT NULL
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        LEFT JOIN pg_constraint c ON c.conindid = x.indexrelid
+        WHERE x.indrelid = 'trades'::regclass
+    """)
+    return dict(cur.fetchall())
+
+def _index_scans(cur) -> Dict[str, int]:
+    """Index name -> scans since the statistics were last reset; partition indexes count for their parent"""
+    parents = _parents(cur)
+    cur.execute("SELECT indexrelname, idx_scan FROM pg_stat_user_indexes")
+    scans: Dict[str, int] = {}
+    for name, n in cur.fetchall():
+        name = parents.get(name, name)
+        scans[name] = scans.get(name, 0) + n
+    return scans
+
+def advise(apply: bool = False, drop_unused: bool = False, runs: int = RUNS) -> List[Dict[str, Any]]:
+    """Evaluate CANDIDATE_INDEXES against workload(), print before/after latency, optionally keep winners"""
     conn = get_db_connection()
     cur = conn.cursor()
+    cur.execute("ANALYZE trades")
+    conn.commit()
+
+    cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'trades' AND column_name = %s",
+                (SCORE_COLUMN,))
+    has_scores = cur.fetchone() is not None
+    if not has_scores:
+        print(f"⏭️  trades has no {SCORE_COLUMN} yet (run batch_scoring.py); skipping the queries and indexes on it")
+    queries = workload(has_scores)
+    candidates = {name: candidate for name, candidate in CANDIDATE_INDEXES.items()
+                  if has_scores or SCORE_COLUMN not in candidate[0]}
+
+    # Taken before the workload runs below, so only the application's own scans count
+    scans = _index_scans(cur)
+    existing = _trade_indexes(cur)
+    before = {label: _measure(cur, sql, runs) for label, sql in queries}
+    best = dict(before)
+    kept = []
+    for name, (definition, purpose) in candidates.items():
+        if name in existing:
+            continue
+        cur.execute(f"CREATE INDEX {name} {definition}")
+        gains = {}
+        for label, sql in queries:
+            if _uses(cur, sql, name):
+                after = _measure(cur, sql, runs)
+                if after['ms'] < best[label]['ms'] * (1 - MIN_GAIN):
+                    gains[label] = after
+        verdict = ("built" if apply else "recommended") if gains else "no gain"
+        print(f"{'✅' if gains else '➖'} {name}: {verdict} ({purpose})")
+        for label, after in gains.items():
+            print(f"     {label}: {best[label]['ms']:.2f} ms -> {after['ms']:.2f} ms")
+        if gains:
+            kept.append(name)
+            best.update(gains)
+        if gains and apply:
+            conn.commit()
+        else:
+            conn.rollback()
+
+    final = {label: _measure(cur, sql, runs) for label, sql in queries} if apply else best
+    used = {scan.split(' ')[-1] for result in final.values() for scan in result['scans']}
+    unused = [name for name, constraint in _trade_indexes(cur).items()
+              if not constraint and name not in used and name not in kept]
+    for name in unused:
+        if scans.get(name):
+            print(f"⚠️  {name} is not used by any workload query, but was scanned {scans[name]:,} times; kept")
+        elif apply and drop_unused:
+            cur.execute(f"DROP INDEX IF EXISTS {name}")
+            print(f"🗑️  Dropped {name}: no workload query uses it and it was never scanned")
+        else:
+            print(f"⚠️  {name} is not used by any workload query (drop with --apply --drop-unused)")
+    conn.commit()
+    cur.close()
+    conn.close()
 
-    indexes = [
-        "CREATE INDEX IF NOT EXISTS idx_trades_status ON trades(status)",
-        "CREATE INDEX IF NOT EXISTS idx_trades_symbol ON trades(symbol)",
-        "CREATE INDEX IF NOT EXISTS idx_trades_trade_date ON trades(trade_date)",
-        "CREATE INDEX IF NOT EXISTS idx_trades_value ON trades((quantity * price))",
-        "CREATE INDEX IF NOT EXISTS idx_trades_buyer ON trades(buyer_id)",
-        "CREATE INDEX IF NOT EXISTS idx_trades_seller ON trades(seller_id)"
+    rows = []
+    print(f"\n{'query':<32}{'before ms':>11}{'after ms':>11}{'speedup':>9}  plan after")
+    for label, _ in queries:
+        b, a = before[label]['ms'], final[label]['ms']
+        rows.append({'query': label, 'before_ms': b, 'after_ms': a, 'scans': final[label]['scans']})
+        print(f"{label:<32}{b:>11.2f}{a:>11.2f}{b / a if a else float('inf'):>8.1f}x  {', '.join(final[label]['scans'])}")
+    if not apply:
+        print("\n(nothing changed; 'after' is with the kept candidates, re-run with --apply to build them)")
+    return rows
+
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+def partition_ddl(cur, months_ahead: int = 3) -> List[str]:
+    """Statements that swap trades for a copy range-partitioned by trade_date month.
+
+    Unique constraints on a partitioned table must include the partition
+    key, so the primary key becomes (id, trade_date) and trade_id is unique
+    per trade_date. The old table is kept as trades_unpartitioned.
+    """
+    cur.execute("SELECT coalesce(min(trade_date), now())::date, CURRENT_DATE FROM trades")
+    first, today = cur.fetchone()
+    statements = [
+        "CREATE TABLE trades_partitioned (LIKE trades INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        "PARTITION BY RANGE (trade_date)",
+        "ALTER TABLE trades_partitioned ADD PRIMARY KEY (id, trade_date)",
+        "ALTER TABLE trades_partitioned ADD UNIQUE (trade_id, trade_date)",
     ]
+    month, last = date(first.year, first.month, 1), today
+    for _ in range(months_ahead):
+        last = _next_month(last)
+    while month <= last:
+        statements.append(
+            f"CREATE TABLE trades_{month:%Y_%m} PARTITION OF trades_partitioned "
+            f"FOR VALUES FROM ('{month}') TO ('{_next_month(month)}')"
+        )
+        month = _next_month(month)
+    statements.append("CREATE TABLE trades_default PARTITION OF trades_partitioned DEFAULT")
+    statements.append("INSERT INTO trades_partitioned SELECT * FROM trades")
 
-    for sql in indexes:
-        cur.execute(sql)
-        print(f"✅ {sql}")
+    # Secondary indexes move over under their own names; constraint-backed ones were recreated above
+    cur.execute("""
+        SELECT i.relname, pg_get_indexdef(x.indexrelid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = 'trades'::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+    """)
+    indexes = cur.fetchall()
+    statements += [f"ALTER INDEX {name} RENAME TO {name[:50]}_unpart" for name, _ in indexes]
+    statements += [
+        "ALTER TABLE trades RENAME TO trades_unpartitioned",
+        "ALTER TABLE trades_partitioned RENAME TO trades",
+        "ALTER SEQUENCE trades_id_seq OWNED BY trades.id",
+    ]
+    statements += [definition for _, definition in indexes]
+    statements.append("ANALYZE trades")
+    return statements
 
+def partition_by_month(apply: bool = False, months_ahead: int = 3) -> List[str]:
+    """Print (and with apply=True run, in one transaction) the monthly partitioning of trades"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    statements = partition_ddl(cur, months_ahead)
+    for sql in statements:
+        print(f"{sql};")
+        if apply:
+            cur.execute(sql)
     conn.commit()
     cur.close()
     conn.close()
+    if apply:
+        print(f"⚡ trades partitioned by month, {months_ahead} months ahead; "
+              "later months land in trades_default until their partition is created")
+    return statements
+
+def optimize_db(apply: bool = True, drop_unused: bool = False):
+    """Build the indexes the workload benefits from (see advise)"""
+    advise(apply=apply, drop_unused=drop_unused)
     print("⚡ Indexing complete.")
+
+if __name__ == "__main__":
+    apply = '--apply' in sys.argv
+    if '--partition' in sys.argv:
+        partition_by_month(apply=apply)
+    else:
+        advise(apply=apply, drop_unused='--drop-unused' in sys.argv)
@@ -0,0 +1,179 @@
+# rollups.py
+"""Daily rollup tables that the API and dashboard read instead of scanning trades.
+
+    python rollups.py              # refresh once
+    python rollups.py --every 60   # refresh every 60 seconds
+    python rollups.py --rebuild    # recompute every day from scratch
+
+trade_daily_rollup holds one row per (day, symbol, status, trade_hour).
+trade_rollup_state holds the created_at watermark and the all-time summary
+served by /stats/summary. A refresh recomputes only the days that gained
+trades since the watermark, plus the last `refresh_days` days, where
+settlement still updates status in place. Older days only change on
+--rebuild.
+"""
+import sys
+import time
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Dict
+
+import psycopg2.errors
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+from db import connection
+
+REFRESH_DAYS = 5
+ROLLUP_LOCK_ID = 7_240_017   # pg advisory lock: one refresh at a time
+HIGH_RISK_VAR = 1000
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS trade_daily_rollup (
+    day DATE NOT NULL,
+    symbol VARCHAR(16) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    trade_hour SMALLINT NOT NULL,
+    trades BIGINT NOT NULL,
+    value_at_risk_sum NUMERIC NOT NULL,
+    high_risk_count BIGINT NOT NULL,
+    high_risk_var_sum NUMERIC NOT NULL,
+    late_count BIGINT NOT NULL,
+    late_days_sum NUMERIC NOT NULL,
+    last_trade_date TIMESTAMP NOT NULL,
+    PRIMARY KEY (day, symbol, status, trade_hour)
+);
+CREATE TABLE IF NOT EXISTS trade_rollup_state (
+    id INT PRIMARY KEY CHECK (id = 1),
+    watermark TIMESTAMPTZ,
+    refreshed_at TIMESTAMPTZ,
+    total_trades BIGINT,
+    failed_trades BIGINT,
+    total_value_at_risk FLOAT8,
+    latest_trade_date TIMESTAMP
+);
+"""
+
+# late_* matches the dashboard's AVG(EXTRACT(DAY FROM actual - settlement)) over late trades
+ROLLUP_SELECT = f"""
+SELECT trade_date::date, symbol, status, extract(hour FROM trade_date)::int,
+       count(*),
+       coalesce(sum(value_at_risk), 0),
+       count(*) FILTER (WHERE value_at_risk > {HIGH_RISK_VAR}),
+       coalesce(sum(value_at_risk) FILTER (WHERE value_at_risk > {HIGH_RISK_VAR}), 0),
+       count(*) FILTER (WHERE actual_settlement_date > settlement_date),
+       coalesce(sum(extract(day FROM actual_settlement_date - settlement_date))
+                FILTER (WHERE actual_settlement_date > settlement_date), 0),
+       max(trade_date)
+FROM trades
+WHERE {{where}}
+GROUP BY 1, 2, 3, 4
+"""
+
+def refresh(conn, refresh_days: int = REFRESH_DAYS, lag: float = 5.0, rebuild: bool = False) -> Dict[str, Any]:
+    """Bring the rollups up to date in one transaction; returns what was recomputed"""
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_SQL)
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (ROLLUP_LOCK_ID,))
+        cur.execute("INSERT INTO trade_rollup_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING")
+        cur.execute("SELECT watermark FROM trade_rollup_state WHERE id = 1")
+        watermark = None if rebuild else cur.fetchone()[0]
+        # Rows created in the last `lag` seconds may still be in flight; leave them for the next refresh
+        cur.execute("SELECT now() - %s * INTERVAL '1 second', CURRENT_DATE", (lag,))
+        until, today = cur.fetchone()
+
+        if watermark is None:
+            cur.execute("DELETE FROM trade_daily_rollup")
+            cur.execute("INSERT INTO trade_daily_rollup " + ROLLUP_SELECT.format(where="TRUE"))
+            days = None
+        else:
+            cur.execute(
+                "SELECT DISTINCT trade_date::date FROM trades WHERE created_at > %s AND created_at <= %s",
+                (watermark, until),
+            )
+            days = {day for (day,) in cur.fetchall()}
+            days |= {today - timedelta(days=i) for i in range(refresh_days)}
+            for day in sorted(days):
+                cur.execute("DELETE FROM trade_daily_rollup WHERE day = %s", (day,))
+                cur.execute(
+                    "INSERT INTO trade_daily_rollup "
+                    + ROLLUP_SELECT.format(where="trade_date >= %(day)s AND trade_date < %(day)s + 1"),
+                    {'day': day},
+                )
+
+        cur.execute("""
+            UPDATE trade_rollup_state s
+            SET watermark = %s, refreshed_at = now(),
+                total_trades = t.total_trades, failed_trades = t.failed_trades,
+                total_value_at_risk = t.total_value_at_risk, latest_trade_date = t.latest_trade_date
+            FROM (
+                SELECT coalesce(sum(trades), 0)::bigint AS total_trades,
+                       coalesce(sum(trades) FILTER (WHERE status = 'FAILED'), 0)::bigint AS failed_trades,
+                       sum(value_at_risk_sum)::float8 AS total_value_at_risk,
+                       max(last_trade_date) AS latest_trade_date
+                FROM trade_daily_rollup
+            ) t
+            WHERE s.id = 1
+        """, (until,))
+    conn.commit()
+    return {'days_refreshed': 'all' if days is None else len(days), 'watermark': until}
+
+def _read(conn, query: str):
+    """Run a rollup read, building the rollups first if they were never built"""
+    for _ in range(2):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT watermark IS NOT NULL FROM trade_rollup_state WHERE id = 1")
+                built = cur.fetchone()
+                if built and built[0]:
+                    cur.execute(query)
+                    return cur.description, cur.fetchall()
+        except psycopg2.errors.UndefinedTable:
+            conn.rollback()
+        refresh(conn)
+    raise RuntimeError("Rollups could not be built")
+
+def summary(conn) -> Dict[str, Any]:
+    """All-time trade summary, read from trade_rollup_state"""
+    description, rows = _read(conn, """
+        SELECT total_trades, failed_trades,
+               failed_trades::float8 / nullif(total_trades, 0) AS failure_rate,
+               total_value_at_risk, latest_trade_date
+        FROM trade_rollup_state WHERE id = 1
+    """)
+    return dict(zip([col[0] for col in description], rows[0]))
+
+def settlement_delays(conn) -> 'pd.DataFrame':
+    """Average whole days late per symbol, over trades that settled late"""
+    import pandas as pd   # keeps pandas out of the API's import path
+    description, rows = _read(conn, """
+        SELECT symbol, (sum(late_days_sum) / sum(late_count))::float8 AS avg_delay_days
+        FROM trade_daily_rollup
+        WHERE late_count > 0
+        GROUP BY symbol
+    """)
+    return pd.DataFrame(rows, columns=[col[0] for col in description])
+
+def high_risk_failure_totals(conn) -> Dict[str, Any]:
+    """Count and total value at risk of failed trades with value_at_risk above HIGH_RISK_VAR"""
+    description, rows = _read(conn, """
+        SELECT coalesce(sum(high_risk_count), 0)::bigint AS failed_trades,
+               coalesce(sum(high_risk_var_sum), 0)::float8 AS value_at_risk
+        FROM trade_daily_rollup
+        WHERE status = 'FAILED'
+    """)
+    return dict(zip([col[0] for col in description], rows[0]))
+
+if __name__ == "__main__":
+    every = float(sys.argv[sys.argv.index('--every') + 1]) if '--every' in sys.argv else None
+    rebuild = '--rebuild' in sys.argv
+    while True:
+        started = time.perf_counter()
+        with connection() as conn:
+            result = refresh(conn, rebuild=rebuild)
+        print(f"✅ Rollups refreshed: {result['days_refreshed']} days in {time.perf_counter() - started:.2f}s "
+              f"(watermark {result['watermark']})")
+        if every is None:
+            break
+        rebuild = False
+        time.sleep(every)
@@ -0,0 +1,102 @@
+# serialization.py
+import base64
+import csv
+import io
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, List, Sequence
+
+import metrics
+
+# Row encoders for cursor tuples, so API responses skip DataFrame and
+# Pydantic materialization entirely
+FORMATS = ('json', 'ndjson', 'csv')
+
+MEDIA_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+dumps = json.JSONEncoder(default=_default, separators=(',', ':')).encode
+
+def encode_row(columns: Sequence[str], row: Sequence) -> str:
+    """One row as a JSON object"""
+    return dumps(dict(zip(columns, row)))
+
+def _csv_text(rows: Iterable[Sequence]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator='\n').writerows(rows)
+    return buf.getvalue()
+
+def _ndjson_text(columns: Sequence[str], rows: Iterable[Sequence]) -> str:
+    return ''.join(encode_row(columns, row) + '\n' for row in rows)
+
+def encode_rows(columns: Sequence[str], rows: List[Sequence], fmt: str = 'json') -> str:
+    """Encode a complete result set in one of FORMATS"""
+    started = time.perf_counter()
+    if fmt == 'json':
+        text = dumps([dict(zip(columns, row)) for row in rows])
+    elif fmt == 'ndjson':
+        text = _ndjson_text(columns, rows)
+    elif fmt == 'csv':
+        text = _csv_text([columns]) + _csv_text(rows)
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+    metrics.SERIALIZE_SECONDS.observe(time.perf_counter() - started, format=fmt)
+    return text
+
+def iter_encoded(columns: Sequence[str], batches: Iterable[List[Sequence]], fmt: str = 'json') -> Iterable[str]:
+    """Encode row batches incrementally, for StreamingResponse bodies"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    if fmt == 'json':
+        yield '['
+    elif fmt == 'csv':
+        yield _csv_text([columns])
+    first = True
+    for batch in batches:
+        if not batch:
+            continue
+        # Only the encoding is timed; fetching the next batch is not
+        started = time.perf_counter()
+        if fmt == 'json':
+            body = ','.join(encode_row(columns, row) for row in batch)
+            if not first:
+                body = ',' + body
+            first = False
+        elif fmt == 'ndjson':
+            body = _ndjson_text(columns, batch)
+        else:
+            body = _csv_text(batch)
+        metrics.SERIALIZE_SECONDS.observe(time.perf_counter() - started, format=fmt)
+        yield body
+    if fmt == 'json':
+        yield ']'
+
+def encode_cursor(trade_date: datetime, trade_id: str) -> str:
+    """Opaque keyset token for the (trade_date, trade_id) of the last row served"""
+    raw = dumps([trade_date.isoformat(), trade_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token: str):
+    """Inverse of encode_cursor; raises ValueError on a malformed token"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        trade_date, trade_id = json.loads(raw)
+        return datetime.fromisoformat(trade_date), str(trade_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {token!r}") from e
+
+def chunked(rows: List[Sequence], size: int) -> Iterable[List[Sequence]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
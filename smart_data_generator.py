@@ -1,7 +1,40 @@
+import io
+import multiprocessing
+import os
+import time
 import uuid
 from datetime import datetime, timedelta
 import random
 
+import numpy as np
+import pandas as pd
+
+from db import get_db_connection
+
+SYMBOLS = np.array(["AAPL", "MSFT", "GOOG", "AMZN", "TSLA", "NVDA", "META", "NFLX", "ADBE", "ORCL"])
+STATUSES = np.array(["SETTLED", "FAILED", "PENDING"])
+STATUS_WEIGHTS = [0.75, 0.15, 0.10]
+FAILURE_REASONS = np.array(["INSUFFICIENT_FUNDS", "BAD_SETTLEMENT", "MISSING_DOCS", "COMPLIANCE_HOLD"])
+
+TRADE_COLUMNS = [
+    "trade_id", "symbol", "quantity", "price", "trade_currency",
+    "trade_date", "settlement_date", "actual_settlement_date",
+    "buyer_id", "seller_id", "status", "failure_reason",
+    "value_at_risk", "is_margin_trade",
+]
+
+COPY_TRADES_SQL = f"COPY trades ({', '.join(TRADE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+# trade_id suffixes are a bijective scramble of the row index, so they never
+# collide within a run (random 48-bit ids would, at tens of millions of rows)
+_ID_MASK = np.uint64((1 << 48) - 1)
+_ID_MULTIPLIER = np.uint64(0x5DEECE66D)
+# Seeded runs draw each block of rows from its own SeedSequence child, so the
+# dataset depends only on (seed, num_trades), never on how work is sharded
+SEED_BLOCK_SIZE = 50_000
+
+_DIGITS = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+
 def generate_smart_trades(num_trades):
     conn = get_db_connection()
     cur = conn.cursor()
@@ -47,3 +80,149 @@ def generate_smart_trades(num_trades):
     cur.close()
     conn.close()
     print("🎉 Smart trade data generated with realistic failures!")
+
+def _format_codes(prefix, values, base, width):
+    """Render integers as fixed-width prefixed strings without a per-row Python loop"""
+    values = np.asarray(values, dtype=np.uint64)
+    head = np.frombuffer(prefix.encode(), dtype=np.uint8)
+    powers = np.uint64(base) ** np.arange(width - 1, -1, -1, dtype=np.uint64)
+    chars = np.empty((len(values), len(head) + width), dtype=np.uint8)
+    chars[:, :len(head)] = head
+    chars[:, len(head):] = _DIGITS[(values[:, None] // powers) % np.uint64(base)]
+    return chars.view(f"S{chars.shape[1]}").ravel().astype(str).astype(object)
+
+def _trade_ids(start, count, key):
+    """Build `count` unique TRD-prefixed ids for rows start..start+count"""
+    x = (np.arange(start, start + count, dtype=np.uint64) + np.uint64(key)) & _ID_MASK
+    x = (x * _ID_MULTIPLIER) & _ID_MASK
+    x ^= x >> np.uint64(24)
+    x = (x * _ID_MULTIPLIER) & _ID_MASK
+    return _format_codes("TRD", x, 16, 12)
+
+def generate_trade_batch(rng, size, id_start=0, id_key=0, as_of=None) -> pd.DataFrame:
+    """Vectorized equivalent of one generate_smart_trades loop, for `size` rows"""
+    as_of = np.datetime64(as_of or datetime.now(), "us")
+
+    status = STATUSES[rng.choice(len(STATUSES), size=size, p=STATUS_WEIGHTS)]
+    quantity = rng.integers(1, 5001, size=size)
+    price = np.round(rng.uniform(5, 3000, size=size), 2)
+    failure_reason = np.where(
+        status == "FAILED", FAILURE_REASONS[rng.integers(0, len(FAILURE_REASONS), size=size)], None
+    )
+    trade_date = as_of - rng.integers(0, 31, size=size).astype("timedelta64[D]")
+    settlement_date = trade_date + rng.integers(1, 4, size=size).astype("timedelta64[D]")
+    actual_settlement_date = np.where(status == "SETTLED", settlement_date, np.datetime64("NaT"))
+    value_at_risk = np.round(quantity * price * rng.uniform(0.001, 0.01, size=size), 4)
+    is_margin_trade = rng.random(size) < 0.25
+
+    return pd.DataFrame({
+        "trade_id": _trade_ids(id_start, size, id_key),
+        "symbol": SYMBOLS[rng.integers(0, len(SYMBOLS), size=size)],
+        "quantity": quantity,
+        "price": price,
+        "trade_currency": "USD",
+        "trade_date": trade_date,
+        "settlement_date": settlement_date,
+        "actual_settlement_date": actual_settlement_date,
+        "buyer_id": _format_codes("BUY_", rng.integers(10000, 100000, size=size), 10, 5),
+        "seller_id": _format_codes("SELL_", rng.integers(10000, 100000, size=size), 10, 5),
+        "status": status,
+        "failure_reason": failure_reason,
+        "value_at_risk": value_at_risk,
+        "is_margin_trade": is_margin_trade,
+    }, columns=TRADE_COLUMNS)
+
+def copy_trades(cur, batch: pd.DataFrame):
+    """Stream a generated batch into trades with COPY FROM STDIN"""
+    # to_csv's per-value datetime formatting dominates otherwise
+    batch = batch.copy(deep=False)
+    for col in ("trade_date", "settlement_date", "actual_settlement_date"):
+        values = batch[col].to_numpy(dtype="datetime64[us]")
+        batch[col] = np.where(np.isnat(values), "", np.datetime_as_string(values, unit="us"))
+
+    buf = io.StringIO()
+    batch.to_csv(buf, header=False, index=False)
+    buf.seek(0)
+    cur.copy_expert(COPY_TRADES_SQL, buf)
+
+def bulk_generate_trades(num_trades, batch_size=50_000, seed=None):
+    """Generate trades in vectorized batches and load them with COPY, committing per batch"""
+    rng = np.random.default_rng(seed)
+    id_key = int(rng.integers(0, 1 << 48))
+    as_of = datetime.now()
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    inserted = 0
+    start = time.perf_counter()
+    try:
+        while inserted < num_trades:
+            size = min(batch_size, num_trades - inserted)
+            batch = generate_trade_batch(rng, size, id_start=inserted, id_key=id_key, as_of=as_of)
+            copy_trades(cur, batch)
+            conn.commit()
+            inserted += size
+
+            elapsed = time.perf_counter() - start
+            print(f"✅ Copied {inserted:,}/{num_trades:,} trades ({inserted / elapsed:,.0f} rows/sec)")
+    finally:
+        cur.close()
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    rows_per_sec = inserted / elapsed if elapsed else 0.0
+    print(f"🎉 Bulk loaded {inserted:,} trades in {elapsed:.1f}s ({rows_per_sec:,.0f} rows/sec)")
+    return {"rows": inserted, "seconds": elapsed, "rows_per_sec": rows_per_sec}
+
+def _generate_shard(args):
+    """Worker: generate and COPY blocks [first_block, last_block) on its own connection"""
+    seed, num_trades, first_block, last_block, id_key, as_of = args
+    conn = get_db_connection()
+    cur = conn.cursor()
+    inserted = 0
+    try:
+        for block in range(first_block, last_block):
+            start = block * SEED_BLOCK_SIZE
+            size = min(SEED_BLOCK_SIZE, num_trades - start)
+            rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block,)))
+            batch = generate_trade_batch(rng, size, id_start=start, id_key=id_key, as_of=as_of)
+            copy_trades(cur, batch)
+            conn.commit()
+            inserted += size
+    finally:
+        cur.close()
+        conn.close()
+    return inserted
+
+def parallel_generate_trades(num_trades, seed, workers=None, as_of=None):
+    """Generate a reproducible trade dataset across a process pool.
+
+    The same (seed, num_trades) always yields the same rows, whatever the
+    worker count. Trade dates are offsets from `as_of` (default: today at
+    midnight), so pin `as_of` to rebuild a dataset identically on another day.
+    """
+    workers = workers or os.cpu_count() or 1
+    as_of = as_of or datetime.combine(datetime.now().date(), datetime.min.time())
+    id_key = int(np.random.SeedSequence(seed).generate_state(1, dtype=np.uint64)[0]) & ((1 << 48) - 1)
+
+    num_blocks = -(-num_trades // SEED_BLOCK_SIZE)
+    workers = max(1, min(workers, num_blocks))
+    bounds = np.linspace(0, num_blocks, workers + 1).astype(int)
+    shards = [
+        (seed, num_trades, int(bounds[i]), int(bounds[i + 1]), id_key, as_of)
+        for i in range(workers)
+    ]
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        inserted = 0
+        for rows in pool.imap_unordered(_generate_shard, shards):
+            inserted += rows
+            elapsed = time.perf_counter() - start
+            print(f"✅ Shard done: {inserted:,}/{num_trades:,} trades ({inserted / elapsed:,.0f} rows/sec)")
+
+    elapsed = time.perf_counter() - start
+    rows_per_sec = inserted / elapsed if elapsed else 0.0
+    print(f"🎉 Generated {inserted:,} trades (seed={seed}) with {workers} workers "
+          f"in {elapsed:.1f}s ({rows_per_sec:,.0f} rows/sec)")
+    return {"rows": inserted, "seconds": elapsed, "rows_per_sec": rows_per_sec, "workers": workers}
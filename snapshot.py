@@ -0,0 +1,167 @@
+# snapshot.py
+"""Local columnar snapshot of the trades table, one Arrow IPC file per trade date.
+
+    python snapshot.py            # sync the last 90 days
+    python snapshot.py --all      # sync full history (e.g. for model training)
+
+sync() writes each missing day once. After that it rewrites only days
+that gained rows since the last sync (found via created_at) and the most
+recent `refresh_days`, where settlements still change status in place.
+load() memory-maps the files and reads only the requested columns and
+dates, so analyses start from local disk without querying Postgres.
+Requires pyarrow.
+"""
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+import trade_store
+from db import connection
+
+SNAPSHOT_DIR = os.environ.get(
+    "TRADE_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots', 'trades')
+)
+MANIFEST = '_manifest.json'
+
+# Everything the analyzer and model training read
+SNAPSHOT_COLUMNS = [c for c in trade_store.STORE_COLUMNS if c != 'trade_currency']
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Trade snapshots require pyarrow (pip install pyarrow)") from e
+    return pa
+
+def _partition_path(snapshot_dir: str, day: date) -> str:
+    return os.path.join(snapshot_dir, f"trade_date={day.isoformat()}.arrow")
+
+def _read_manifest(snapshot_dir: str) -> Dict[str, Any]:
+    path = os.path.join(snapshot_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'watermark': None, 'partitions': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_atomic(path: str, write):
+    tmp = path + '.tmp'
+    write(tmp)
+    os.replace(tmp, path)
+
+def _write_manifest(snapshot_dir: str, manifest: Dict[str, Any]):
+    def write(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    _write_atomic(os.path.join(snapshot_dir, MANIFEST), write)
+
+def _write_partition(snapshot_dir: str, day: date) -> int:
+    pa = _pyarrow()
+    frame = trade_store.load_trades(
+        f"trade_date >= '{day.isoformat()}' AND trade_date < '{(day + timedelta(days=1)).isoformat()}'",
+        SNAPSHOT_COLUMNS,
+    )
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+
+    def write(tmp):
+        # Uncompressed IPC files can be memory-mapped and read without copying
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    _write_atomic(_partition_path(snapshot_dir, day), write)
+    return len(frame)
+
+def sync(snapshot_dir: str = SNAPSHOT_DIR, days: Optional[int] = 90, refresh_days: int = 5,
+         lag: float = 5.0) -> Dict[str, Any]:
+    """Bring the snapshot up to date; `days=None` covers the full history"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest = _read_manifest(snapshot_dir)
+    known = set(manifest['partitions'])
+    with connection() as conn, conn.cursor() as cur:
+        # Rows created in the last `lag` seconds may still be in flight; leave them for the next sync
+        cur.execute("SELECT now() - %s * INTERVAL '1 second', CURRENT_DATE", (lag,))
+        until, today = cur.fetchone()
+        first_day = today - timedelta(days=days) if days is not None else date.min
+
+        changed = set()
+        covered_from = manifest.get('covered_from')
+        if covered_from is None or first_day < date.fromisoformat(covered_from):
+            # First sync, or a wider window than before: find every day not yet on disk
+            cur.execute("SELECT DISTINCT trade_date::date FROM trades WHERE trade_date >= %s", (first_day,))
+            changed |= {day for (day,) in cur.fetchall() if str(day) not in known}
+            covered_from = first_day.isoformat()
+        if manifest['watermark'] is not None:
+            # Days that gained rows since the last sync (idx_trades_created_at)
+            cur.execute(
+                "SELECT DISTINCT trade_date::date FROM trades "
+                "WHERE created_at > %s AND created_at <= %s AND trade_date >= %s",
+                (manifest['watermark'], until, first_day),
+            )
+            changed |= {day for (day,) in cur.fetchall()}
+
+    recent = {today - timedelta(days=i) for i in range(refresh_days)}
+    to_write = sorted(changed | {day for day in recent if str(day) in known})
+
+    written = 0
+    for day in to_write:
+        rows = _write_partition(snapshot_dir, day)
+        manifest['partitions'][str(day)] = {'rows': rows, 'written_at': datetime.now().isoformat()}
+        written += rows
+    manifest['watermark'] = until.isoformat()
+    manifest['covered_from'] = covered_from
+    _write_manifest(snapshot_dir, manifest)
+    print(f"✅ Snapshot synced: {len(to_write)} partitions, {written:,} rows written to {snapshot_dir}")
+    return {'partitions_written': len(to_write), 'rows_written': written, 'watermark': manifest['watermark']}
+
+def partitions(snapshot_dir: str = SNAPSHOT_DIR) -> List[date]:
+    return sorted(date.fromisoformat(d) for d in _read_manifest(snapshot_dir)['partitions'])
+
+def load(snapshot_dir: str = SNAPSHOT_DIR, columns: Optional[Sequence[str]] = None,
+         after: Optional[datetime] = None, until: Optional[datetime] = None) -> pd.DataFrame:
+    """Trades with `after < trade_date <= until` from the memory-mapped partitions.
+
+    Only partitions overlapping the range are opened and only `columns` are
+    materialised (default: trade_store.ANALYSIS_COLUMNS).
+    """
+    pa = _pyarrow()
+    columns = list(columns or trade_store.ANALYSIS_COLUMNS)
+    read = columns if 'trade_date' in columns else columns + ['trade_date']
+    days = [d for d in partitions(snapshot_dir)
+            if (after is None or d >= after.date()) and (until is None or d <= until.date())]
+
+    tables = []
+    for day in days:
+        source = pa.memory_map(_partition_path(snapshot_dir, day), 'r')
+        tables.append(pa.ipc.open_file(source).read_all().select(read))
+    if not tables:
+        return pd.DataFrame({c: pd.Series(dtype=trade_store.STORE_COLUMNS[c][1]) for c in columns})
+
+    # Each partition carries its own dictionaries; unify them so categoricals survive the concat
+    frame = pa.concat_tables(tables).unify_dictionaries().to_pandas(split_blocks=True)
+    if after is not None or until is not None:
+        in_range = pd.Series(True, index=frame.index)
+        if after is not None:
+            in_range &= frame['trade_date'] > pd.Timestamp(after)
+        if until is not None:
+            in_range &= frame['trade_date'] <= pd.Timestamp(until)
+        frame = frame[in_range].reset_index(drop=True)
+    return frame[columns]
+
+def prune(snapshot_dir: str = SNAPSHOT_DIR, keep_days: int = 90) -> int:
+    """Delete partitions older than `keep_days`; returns how many were removed"""
+    manifest = _read_manifest(snapshot_dir)
+    cutoff = date.today() - timedelta(days=keep_days)
+    removed = [d for d in manifest['partitions'] if date.fromisoformat(d) < cutoff]
+    for d in removed:
+        path = _partition_path(snapshot_dir, date.fromisoformat(d))
+        if os.path.exists(path):
+            os.remove(path)
+        del manifest['partitions'][d]
+    _write_manifest(snapshot_dir, manifest)
+    return len(removed)
+
+if __name__ == "__main__":
+    sync(days=None if '--all' in sys.argv else 90)
@@ -0,0 +1,34 @@
+# tests/conftest.py
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features import FEATURE_NAMES, FEATURE_SCHEMA, build_features  # noqa: E402
+
+@pytest.fixture(scope="session")
+def trade_features():
+    """Feature matrix for 2,000 synthetic trades, built by the shared pipeline"""
+    rng = np.random.default_rng(7)
+    n = 2000
+    return build_features({
+        'quantity': rng.integers(1, 5000, n),
+        'price': rng.uniform(1, 500, n),
+        'is_margin_trade': rng.random(n) < 0.3,
+        'value_at_risk': np.where(rng.random(n) < 0.2, np.nan, rng.uniform(0, 20_000, n)),
+    })
+
+@pytest.fixture(scope="session")
+def fitted_model(trade_features):
+    """Small RandomForestClassifier fitted on the pipeline's features and stamped with its schema"""
+    pd = pytest.importorskip("pandas")
+    ensemble = pytest.importorskip("sklearn.ensemble")
+    X = pd.DataFrame(trade_features, columns=FEATURE_NAMES)
+    y = (X['trade_value'] * (1 + X['is_margin_trade']) > 150_000).to_numpy()
+    y ^= np.random.default_rng(1).random(len(y)) < 0.1
+    model = ensemble.RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(X, y)
+    model.feature_schema_ = FEATURE_SCHEMA
+    return model
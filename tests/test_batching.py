@@ -0,0 +1,49 @@
+# tests/test_batching.py
+import asyncio
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+def _double(X: np.ndarray) -> np.ndarray:
+    if not np.isfinite(X).all():
+        raise ValueError("Input X contains NaN or infinity")
+    return X[:, 0] * 2
+
+async def _submit_all(batcher, rows):
+    return await asyncio.gather(*(batcher.submit(np.array(row)) for row in rows), return_exceptions=True)
+
+def test_concurrent_requests_share_one_call():
+    calls = []
+
+    def score(X):
+        calls.append(len(X))
+        return _double(X)
+
+    batcher = MicroBatcher(score, max_rows=64, max_wait=0.05)
+    results = asyncio.run(_submit_all(batcher, [[float(i)] for i in range(10)]))
+    assert results == [2.0 * i for i in range(10)]
+    assert calls == [10]
+    assert batcher.stats()['batches'] == 1
+
+def test_failing_row_fails_only_its_request():
+    batcher = MicroBatcher(_double, max_rows=64, max_wait=0.05)
+    results = asyncio.run(_submit_all(batcher, [[1.0], [np.inf], [3.0]]))
+    assert results[0] == 2.0 and results[2] == 6.0
+    assert isinstance(results[1], ValueError)
+
+def test_max_rows_splits_batches():
+    calls = []
+
+    def score(X):
+        calls.append(len(X))
+        return _double(X)
+
+    asyncio.run(_submit_all(MicroBatcher(score, max_rows=4, max_wait=0.05), [[1.0]] * 10))
+    assert calls == [4, 4, 2]
+
+@pytest.mark.parametrize("kwargs", [{'max_rows': 0}, {'max_rows': -1}, {'max_wait': -0.001}])
+def test_invalid_settings_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        MicroBatcher(_double, **kwargs)
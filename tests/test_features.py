@@ -0,0 +1,55 @@
+# tests/test_features.py
+import copy
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import features
+import forest
+
+def _pickle(model, tmp_path, name="model.pkl"):
+    path = str(tmp_path / name)
+    with open(path, 'wb') as f:
+        pickle.dump(model, f)
+    return path
+
+def test_export_carries_the_training_schema(fitted_model):
+    assert forest.compile_forest(fitted_model).meta['feature_schema'] == features.FEATURE_SCHEMA
+
+def test_stamped_model_loads(fitted_model, tmp_path):
+    model = features.load_model(_pickle(fitted_model, tmp_path))
+    assert features.model_schema(model) == features.FEATURE_SCHEMA
+
+def test_unstamped_model_is_rejected_and_not_exported(fitted_model, tmp_path):
+    unstamped = copy.deepcopy(fitted_model)
+    del unstamped.feature_schema_
+    path = _pickle(unstamped, tmp_path)
+    with pytest.raises(features.FeatureSchemaError, match="no feature schema"):
+        features.load_model(path)
+    assert not os.path.exists(forest.compiled_path(path))
+
+def test_mismatched_schema_is_rejected(fitted_model, tmp_path):
+    stale = copy.deepcopy(fitted_model)
+    stale.feature_schema_ = {**features.FEATURE_SCHEMA, 'version': features.FEATURE_SCHEMA_VERSION + 1}
+    with pytest.raises(features.FeatureSchemaError, match="pipeline builds"):
+        features.load_model(_pickle(stale, tmp_path))
+
+def test_unstamped_export_is_recompiled_from_a_stamped_pickle(fitted_model, tmp_path):
+    path = _pickle(fitted_model, tmp_path)
+    unstamped = copy.deepcopy(fitted_model)
+    del unstamped.feature_schema_
+    forest.save_forest(forest.compile_forest(unstamped), forest.compiled_path(path))
+    os.utime(path, (0, 0))   # the bad export looks fresh
+    assert features.model_schema(features.load_model(path)) == features.FEATURE_SCHEMA
+
+def test_explicit_schema_must_name_the_fitted_columns(fitted_model):
+    unstamped = copy.deepcopy(fitted_model)
+    del unstamped.feature_schema_
+    with pytest.raises(ValueError, match="was fitted on"):
+        forest.compile_forest(unstamped, {'version': 1, 'features': ['quantity', 'price']})
+
+def test_build_features_fills_defaults():
+    X = features.build_features({'quantity': [10], 'price': [2.0]})
+    np.testing.assert_allclose(X[0], [10, 2.0, 0.0, 20 * features.DEFAULT_VAR_RATE, 20])
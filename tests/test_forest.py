@@ -0,0 +1,34 @@
+# tests/test_forest.py
+import numpy as np
+import pytest
+
+import forest
+
+def test_compiled_forest_matches_sklearn(fitted_model, trade_features):
+    compiled = forest.compile_forest(fitted_model)
+    np.testing.assert_array_equal(compiled.predict_proba(trade_features), fitted_model.predict_proba(trade_features))
+
+def test_matches_sklearn_on_split_thresholds(fitted_model):
+    # Rows sitting exactly on (and just around) split thresholds exercise the float32 rounding
+    compiled = forest.compile_forest(fitted_model)
+    thresholds = np.concatenate([t for t in compiled.thresholds if len(t)]).astype(np.float64)
+    rng = np.random.default_rng(3)
+    X = rng.choice(thresholds, size=(500, compiled.n_features_in_))
+    X = np.concatenate([X, np.nextafter(X, np.inf), np.nextafter(X, -np.inf)])
+    np.testing.assert_array_equal(compiled.predict_proba(X), fitted_model.predict_proba(X))
+
+def test_saved_forest_loads_mmapped(fitted_model, trade_features, tmp_path):
+    compiled = forest.compile_forest(fitted_model)
+    path = str(tmp_path / "model.forest")
+    forest.save_forest(compiled, path)
+    loaded = forest.load_forest(path)
+    assert isinstance(loaded.masks[0], np.memmap)
+    assert loaded.meta == compiled.meta
+    np.testing.assert_array_equal(loaded.predict_proba(trade_features), compiled.predict_proba(trade_features))
+
+def test_rejects_non_finite_rows(fitted_model):
+    compiled = forest.compile_forest(fitted_model)
+    X = np.ones((2, compiled.n_features_in_))
+    X[1, 4] = np.inf
+    with pytest.raises(ValueError, match="NaN or infinity"):
+        compiled.predict_proba(X)
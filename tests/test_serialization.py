@@ -0,0 +1,21 @@
+# tests/test_serialization.py
+from datetime import datetime
+
+import pytest
+
+from serialization import decode_cursor, encode_cursor
+
+@pytest.mark.parametrize("trade_date, trade_id", [
+    (datetime(2024, 3, 1, 9, 30), "TRD0001"),
+    (datetime(2024, 12, 31, 23, 59, 59, 999999), "TRD-ü/+=?"),
+    (datetime(1999, 1, 1), ""),
+])
+def test_cursor_round_trip(trade_date, trade_id):
+    token = encode_cursor(trade_date, trade_id)
+    assert "=" not in token and "/" not in token and "+" not in token
+    assert decode_cursor(token) == (trade_date, trade_id)
+
+@pytest.mark.parametrize("token", ["", "not-a-cursor", encode_cursor(datetime(2024, 1, 1), "x")[:-3]])
+def test_malformed_cursor_raises_value_error(token):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(token)
@@ -0,0 +1,79 @@
+# tests/test_trade_grain.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import trade_grain
+
+@pytest.fixture(scope="module")
+def trades():
+    rng = np.random.default_rng(11)
+    n = 5000
+    start = pd.Timestamp("2024-03-01")
+    trade_date = start + pd.to_timedelta(rng.integers(0, 10 * 86400, n), unit="s")
+    trade_date = trade_date.where(rng.random(n) > 0.05, trade_date.normalize())   # some exactly at midnight
+    settlement = trade_date.normalize() + pd.Timedelta(days=2)
+    actual = settlement + pd.to_timedelta(rng.integers(-1, 5, n), unit="D") + pd.to_timedelta(rng.integers(0, 86400, n), unit="s")
+    var = rng.choice([np.nan, 0.0, -5.0, 1000.0, 5000.0, 10000.0, 50000.0], n)
+    var = np.where(rng.random(n) < 0.6, rng.uniform(1, 80_000, n), var)
+    return pd.DataFrame({
+        'symbol': rng.choice(['AAPL', 'MSFT', 'TSLA', 'AMZN'], n),
+        'status': rng.choice(['FAILED', 'SETTLED', 'PENDING'], n),
+        'value_at_risk': var,
+        'trade_date': trade_date,
+        'settlement_date': settlement,
+        'actual_settlement_date': actual.where(rng.random(n) > 0.3),
+    })
+
+def _baseline(df: pd.DataFrame) -> pd.DataFrame:
+    """The grain computed the plain pandas way (pd.cut, dt accessors, a multi-key groupby)"""
+    delay = np.floor((df['actual_settlement_date'] - df['settlement_date']) / pd.Timedelta(days=1))
+    delayed = delay > 0
+    bucket = pd.cut(df['value_at_risk'], trade_grain.VAR_BINS, labels=False)
+    frame = pd.DataFrame({
+        'window_day': (df['trade_date'] - pd.Timedelta(1, 'ns')).dt.floor('D'),
+        'symbol': df['symbol'],
+        'trade_hour': df['trade_date'].dt.hour,
+        'trade_day': df['trade_date'].dt.day_name(),
+        'risk_bucket': bucket.fillna(trade_grain.NO_BUCKET).astype(int),
+        'failed': df['status'] == 'FAILED',
+        'settled': df['status'] == 'SETTLED',
+        'var': df['value_at_risk'],
+        'delay': delay.where(delayed),
+        'trade_date': df['trade_date'],
+    })
+    return frame.groupby(trade_grain.GRAIN_KEYS).agg(
+        trades=('failed', 'size'),
+        failed=('failed', 'sum'),
+        settled=('settled', 'sum'),
+        var_sum=('var', 'sum'),
+        var_count=('var', 'count'),
+        delay_sum=('delay', 'sum'),
+        delay_count=('delay', 'count'),
+        first_trade_date=('trade_date', 'min'),
+        last_trade_date=('trade_date', 'max'),
+        delay_max=('delay', 'max'),
+    ).reset_index()
+
+def _sorted(grain: pd.DataFrame) -> pd.DataFrame:
+    columns = trade_grain.GRAIN_KEYS + trade_grain.SUM_COLUMNS + trade_grain.MIN_COLUMNS + trade_grain.MAX_COLUMNS
+    return grain[columns].sort_values(trade_grain.GRAIN_KEYS).reset_index(drop=True)
+
+def test_grain_from_frame_matches_pandas_baseline(trades):
+    pd.testing.assert_frame_equal(_sorted(trade_grain.grain_from_frame(trades)), _sorted(_baseline(trades)),
+                                  check_dtype=False)
+
+def test_merged_chunks_match_one_pass(trades):
+    chunks = [trade_grain.grain_from_frame(trades.iloc[i:i + 700]) for i in range(0, len(trades), 700)]
+    pd.testing.assert_frame_equal(_sorted(trade_grain.merge(*chunks)), _sorted(trade_grain.grain_from_frame(trades)),
+                                  check_dtype=False)
+
+def test_categorical_symbols_give_the_same_grain(trades):
+    categorical = trades.assign(symbol=trades['symbol'].astype('category'))
+    pd.testing.assert_frame_equal(_sorted(trade_grain.grain_from_frame(categorical)),
+                                  _sorted(trade_grain.grain_from_frame(trades)), check_dtype=False)
+
+def test_expire_drops_days_before_the_window(trades):
+    grain = trade_grain.expire(trade_grain.grain_from_frame(trades), "2024-03-05")
+    assert grain['window_day'].min() == pd.Timestamp("2024-03-05")
+    assert grain['trades'].sum() == (trades['trade_date'] > pd.Timestamp("2024-03-05")).sum()
@@ -0,0 +1,41 @@
+# tests/test_trade_stream.py
+import numpy as np
+import pytest
+
+from trade_stream import QuantileSketch
+
+QUANTILES = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+
+def _rank_value(values: np.ndarray, q: float) -> float:
+    """The observed value at the rank the sketch targets (lower, not interpolated)"""
+    return np.sort(values)[int(q * (len(values) - 1))]
+
+@pytest.mark.parametrize("values", [
+    np.random.default_rng(0).lognormal(8, 2, 50_000),
+    np.random.default_rng(1).normal(0, 1000, 50_000),
+    np.random.default_rng(2).integers(-3, 30, 50_000).astype(float),
+], ids=["lognormal", "signed", "integer-days"])
+@pytest.mark.parametrize("accuracy", [0.01, 0.05])
+def test_quantiles_within_relative_accuracy(values, accuracy):
+    sketch = QuantileSketch(accuracy).add(values)
+    for q in QUANTILES:
+        expected = _rank_value(values, q)
+        assert abs(sketch.quantile(q) - expected) <= accuracy * abs(expected) + 1e-12, q
+
+def test_merged_sketches_equal_one_sketch():
+    values = np.random.default_rng(4).lognormal(5, 1.5, 30_000)
+    merged = QuantileSketch()
+    for part in np.array_split(values, 7):
+        merged.merge(QuantileSketch().add(part))
+    whole = QuantileSketch().add(values)
+    assert (merged.count, merged.min, merged.max) == (whole.count, whole.min, whole.max)
+    assert [merged.quantile(q) for q in QUANTILES] == [whole.quantile(q) for q in QUANTILES]
+
+def test_nan_is_ignored_and_empty_is_nan():
+    assert np.isnan(QuantileSketch().quantile(0.5))
+    sketch = QuantileSketch().add([np.nan, 2.0, np.nan])
+    assert sketch.count == 1 and sketch.quantile(0.5) == 2.0
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
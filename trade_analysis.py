@@ -1,144 +1,371 @@
 # trade_analysis.py
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime, timedelta
-import psycopg2
-from typing import Dict, List, Any
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Any, Optional
+import functools
+import threading
 import warnings
 warnings.filterwarnings('ignore')
 
-# Database connection
-def get_db_connection():
-    # return psycopg2.connect(
-    #     host="localhost",
-    #     port=5435,
-    #     dbname="trading_db",
-    #     user="trader",
-    #     password="securepass123"
-    # )
-    return psycopg2.connect(os.environ["DATABASE_URL"])
+import metrics
+import snapshot
+import trade_grain
+import trade_store
+import trade_stream
+from db import connection
+from trade_grain import VAR_LABELS
+
+# 'memory' loads the window into one DataFrame; 'pushdown' runs each
+# analysis as a server-side aggregate and only fetches the (small) result;
+# 'incremental' keeps per-grain aggregates (trade_grain.py) and refresh()
+# folds in only the trades created since the last refresh; 'streaming'
+# builds the same aggregates chunk by chunk (trade_stream.py), for windows
+# that do not fit in memory
+MODES = ('memory', 'pushdown', 'incremental', 'streaming')
+
+# Where memory mode loads its frame from: Postgres, or the local Arrow
+# snapshot kept by snapshot.sync() (no database round trip at all)
+SOURCES = ('db', 'snapshot')
+
+WINDOW_DAYS = 90
+
+def window_sql(days: int = WINDOW_DAYS) -> str:
+    return f"trade_date > CURRENT_DATE - INTERVAL '{int(days)} days'"
+
+WINDOW_SQL = window_sql()
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+CORRELATION_COLUMNS = {
+    'quantity': 'quantity::float8',
+    'price': 'price::float8',
+    'value_at_risk': 'value_at_risk::float8',
+    'abs_quantity': 'abs(quantity)::float8',
+    'is_failed': "(status = 'FAILED')::int::float8",
+    'is_sell': '(quantity < 0)::int::float8',
+}
+
+def _copy(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return result.copy()
+    if isinstance(result, dict):
+        return {k: _copy(v) for k, v in result.items()}
+    return result
+
+def _step(method):
+    """Record each call's duration in analyzer_step_seconds, labelled with the mode"""
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        with metrics.ANALYZER_STEP_SECONDS.time(mode=self.mode, step=method.__name__):
+            return method(self, *args, **kwargs)
+    return timed
 
 class TradeAnalyzer:
-    def __init__(self):
-        self.conn = get_db_connection()
-        self.df = self.load_all_trades()
+    def __init__(self, mode: str = 'memory', refresh_lag: float = 5.0,
+                 columns: Optional[List[str]] = None, source: str = 'db',
+                 snapshot_dir: str = snapshot.SNAPSHOT_DIR, window_days: int = WINDOW_DAYS,
+                 workers: int = 1, chunk_rows: int = trade_stream.CHUNK_ROWS):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        if source not in SOURCES:
+            raise ValueError(f"source must be one of {SOURCES}, got {source!r}")
+        if source == 'snapshot' and mode != 'memory':
+            raise ValueError("source='snapshot' needs mode='memory'")
+        self.mode = mode
+        self.source = source
+        self.snapshot_dir = snapshot_dir
+        self.window_days = window_days
+        self.window_sql = window_sql(window_days)
+        # streaming mode: processes streaming the window in parallel, and rows per fetch
+        self.workers = workers
+        self.chunk_rows = chunk_rows
+        self.sketches = None
+        # Rows created within `refresh_lag` seconds of a refresh wait for the next
+        # one, so transactions still in flight are not skipped by the watermark
+        self.refresh_lag = refresh_lag
+        # memory mode loads only these columns (trade_store.ANALYSIS_COLUMNS by default)
+        self.columns = columns
+        self.watermark = None
+        # (grain table, cached results), replaced together whenever the data changes
+        self._snapshot = (trade_grain.empty(), {}) if mode == 'incremental' else None
+        self._refresh_lock = threading.Lock()   # analyzers may be shared, e.g. st.cache_resource
+        self.df = self.load_all_trades() if mode == 'memory' else None
+        if mode == 'incremental':
+            self.refresh()
+        elif mode == 'streaming':
+            self._state()
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self._df
+
+    @df.setter
+    def df(self, value: pd.DataFrame):
+        # Assigning new data drops the grain and every cached result
+        self._df = value
+        if self.mode == 'memory':
+            self._snapshot = None
     
+    @_step
     def load_all_trades(self) -> pd.DataFrame:
-        """Load all trades from database"""
-        query = """
-        SELECT * FROM trades 
-        WHERE trade_date > CURRENT_DATE - INTERVAL '90 days'
+        """Load the window as a compact typed frame (see trade_store.py)"""
+        if self.source == 'snapshot':
+            after = datetime.combine(date.today() - timedelta(days=self.window_days), datetime.min.time())
+            return snapshot.load(self.snapshot_dir, self.columns, after=after)
+        return trade_store.load_trades(self.window_sql, self.columns)
+
+    def _query(self, name: str, query: str) -> pd.DataFrame:
+        """Run an aggregate query and return its (small) result as a DataFrame"""
+        with connection() as conn, conn.cursor() as cur, metrics.db_query(f"trade_analysis.{name}") as timer:
+            cur.execute(query)
+            rows = timer.returned(cur.fetchall())
+            return pd.DataFrame(rows, columns=[d[0] for d in cur.description])
+
+    def _state(self):
+        state = self._snapshot
+        if state is None:
+            with metrics.ANALYZER_STEP_SECONDS.time(mode=self.mode, step='build_grain'):
+                if self.mode == 'streaming':
+                    grain, self.sketches = trade_stream.stream_window(self.window_days, self.workers, self.chunk_rows)
+                else:
+                    # memory mode: one fused pass over self.df builds the grain for every analysis
+                    grain = trade_grain.grain_from_frame(self.df)
+            state = self._snapshot = (grain, {})
+        return state
+
+    def _cached(self, name: str, compute):
+        """Result of `compute(grain)`, cached until the data changes; callers get a copy"""
+        grain, results = self._state()
+        if name not in results:
+            results[name] = compute(grain)
+        return _copy(results[name])
+
+    @_step
+    def refresh(self) -> int:
+        """Fold in trades created since the last refresh and expire days that left the window.
+
+        Cost scales with the new trades (idx_trades_created_at), not with the
+        window. Only inserts are picked up; a trade updated in place keeps
+        the status it had when it was first aggregated. Returns the number
+        of trades added.
         """
-        return pd.read_sql(query, self.conn)
+        if self.mode != 'incremental':
+            raise ValueError("refresh() needs mode='incremental'")
+        with self._refresh_lock, connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT now() - %s * INTERVAL '1 second', CURRENT_DATE - %s",
+                        (self.refresh_lag, self.window_days))
+            until, first_day = cur.fetchone()
+            where = f"{self.window_sql} AND created_at <= %(until)s"
+            if self.watermark is not None:
+                where += " AND created_at > %(since)s"
+            with metrics.db_query("trade_analysis.refresh") as timer:
+                cur.execute(trade_grain.grain_query(where), {'until': until, 'since': self.watermark})
+                rows = timer.returned(cur.fetchall())
+            new = pd.DataFrame(rows, columns=[d[0] for d in cur.description])
+
+            grain = self._snapshot[0]
+            merged = trade_grain.expire(trade_grain.merge(grain, new), first_day)
+            if len(new) or len(merged) != len(grain):
+                self._snapshot = (merged, {})
+            self.watermark = until
+        return int(new['trades'].sum()) if len(new) else 0
     
+    @_step
     def basic_stats(self) -> Dict[str, Any]:
         """Get basic statistics about trades"""
+        if self.mode == 'pushdown':
+            return self._pushdown_basic_stats()
+        return self._cached('basic_stats', trade_grain.basic_stats)
+    
+    def _pushdown_basic_stats(self) -> Dict[str, Any]:
+        row = self._query('basic_stats', f"""
+        SELECT count(*) AS total_trades,
+               count(*) FILTER (WHERE status = 'FAILED') AS failed_trades,
+               count(*) FILTER (WHERE status = 'SETTLED') AS settled_trades,
+               sum(value_at_risk)::float8 AS total_value,
+               avg(value_at_risk)::float8 AS avg_trade_size,
+               min(trade_date) AS start,
+               max(trade_date) AS end
+        FROM trades
+        WHERE {self.window_sql}
+        """).iloc[0]
         stats = {
-            'total_trades': len(self.df),
-            'failed_trades': len(self.df[self.df['status'] == 'FAILED']),
-            'settled_trades': len(self.df[self.df['status'] == 'SETTLED']),
-            'total_value': self.df['value_at_risk'].sum(),
-            'avg_trade_size': self.df['value_at_risk'].mean(),
+            'total_trades': int(row['total_trades']),
+            'failed_trades': int(row['failed_trades']),
+            'settled_trades': int(row['settled_trades']),
+            'total_value': row['total_value'] if pd.notna(row['total_value']) else 0.0,
+            'avg_trade_size': row['avg_trade_size'] if pd.notna(row['avg_trade_size']) else np.nan,
             'date_range': {
-                'start': self.df['trade_date'].min(),
-                'end': self.df['trade_date'].max()
+                'start': pd.Timestamp(row['start']),
+                'end': pd.Timestamp(row['end'])
             }
         }
         stats['failure_rate'] = stats['failed_trades'] / stats['total_trades']
         return stats
     
+    @_step
     def failure_analysis_by_symbol(self) -> pd.DataFrame:
         """Analyze failure rates by symbol"""
-        result = self.df.groupby('symbol').agg({
-            'trade_id': 'count',
-            'status': lambda x: (x == 'FAILED').sum(),
-            'value_at_risk': ['sum', 'mean']
-        }).round(2)
-        
-        result.columns = ['total_trades', 'failed_trades', 'total_var', 'avg_var']
-        result['failure_rate'] = (result['failed_trades'] / result['total_trades']).round(3)
-        result = result.sort_values('failure_rate', ascending=False)
-        return result
+        if self.mode == 'pushdown':
+            result = self._query('failure_analysis_by_symbol', f"""
+            SELECT symbol,
+                   count(trade_id) AS total_trades,
+                   count(*) FILTER (WHERE status = 'FAILED') AS failed_trades,
+                   sum(value_at_risk)::float8 AS total_var,
+                   avg(value_at_risk)::float8 AS avg_var
+            FROM trades
+            WHERE {self.window_sql}
+            GROUP BY symbol
+            """).set_index('symbol').sort_index().fillna({'total_var': 0.0}).round(2)
+            result['failure_rate'] = (result['failed_trades'] / result['total_trades']).round(3)
+            return result.sort_values('failure_rate', ascending=False)
+
+        return self._cached('failure_analysis_by_symbol', trade_grain.failure_analysis_by_symbol)
     
+    @_step
     def time_based_analysis(self) -> pd.DataFrame:
         """Analyze patterns by time of day and day of week"""
-        self.df['trade_hour'] = self.df['trade_date'].dt.hour
-        self.df['trade_day'] = self.df['trade_date'].dt.day_name()
-        self.df['trade_date_only'] = self.df['trade_date'].dt.date
-        
-        # Hourly analysis
-        hourly = self.df.groupby('trade_hour').agg({
-            'trade_id': 'count',
-            'status': lambda x: (x == 'FAILED').sum()
-        })
-        hourly['failure_rate'] = (hourly['status'] / hourly['trade_id']).round(3)
-        
-        # Daily analysis
-        daily = self.df.groupby('trade_day').agg({
-            'trade_id': 'count', 
-            'status': lambda x: (x == 'FAILED').sum()
-        })
-        daily['failure_rate'] = (daily['status'] / daily['trade_id']).round(3)
-        
-        return {
-            'hourly': hourly,
-            'daily': daily
-        }
+        if self.mode == 'pushdown':
+            return self._pushdown_time_based_analysis()
+        return self._cached('time_based_analysis', trade_grain.time_based_analysis)
+    
+    def _pushdown_time_based_analysis(self) -> Dict[str, pd.DataFrame]:
+        grouped = {}
+        for name, key, expr in (('hourly', 'trade_hour', 'extract(hour FROM trade_date)::int'),
+                                ('daily', 'trade_day', "to_char(trade_date, 'FMDay')")):
+            frame = self._query('time_based_analysis', f"""
+            SELECT {expr} AS {key},
+                   count(trade_id) AS trade_id,
+                   count(*) FILTER (WHERE status = 'FAILED') AS status
+            FROM trades
+            WHERE {self.window_sql}
+            GROUP BY 1
+            """).set_index(key).sort_index()
+            frame['failure_rate'] = (frame['status'] / frame['trade_id']).round(3)
+            grouped[name] = frame
+        return grouped
     
+    @_step
     def value_at_risk_analysis(self) -> Dict[str, Any]:
         """Analyze Value at Risk patterns"""
-        # Risk categories
-        var_bins = [0, 1000, 5000, 10000, 50000, float('inf')]
-        var_labels = ['Very Low', 'Low', 'Medium', 'High', 'Very High']
-        
-        self.df['risk_category'] = pd.cut(
-            self.df['value_at_risk'], 
-            bins=var_bins, 
-            labels=var_labels
-        )
-        
-        risk_analysis = self.df.groupby('risk_category').agg({
-            'trade_id': 'count',
-            'status': lambda x: (x == 'FAILED').sum(),
-            'value_at_risk': 'sum'
-        })
+        if self.mode == 'pushdown':
+            return self._pushdown_value_at_risk_analysis()
+        return self._cached('value_at_risk_analysis', trade_grain.value_at_risk_analysis)
+    
+    def _pushdown_value_at_risk_analysis(self) -> pd.DataFrame:
+        # Same right-closed bins as pd.cut: (0, 1000], (1000, 5000], ...
+        found = self._query('value_at_risk_analysis', f"""
+        SELECT {trade_grain.risk_bucket_sql()} AS bucket,
+               count(trade_id) AS trade_id,
+               count(*) FILTER (WHERE status = 'FAILED') AS status,
+               sum(value_at_risk)::float8 AS value_at_risk
+        FROM trades
+        WHERE {self.window_sql} AND value_at_risk > 0
+        GROUP BY 1
+        """).set_index('bucket')
+
+        categories = pd.CategoricalIndex(VAR_LABELS, categories=VAR_LABELS, ordered=True, name='risk_category')
+        risk_analysis = found.reindex(range(len(VAR_LABELS)), fill_value=0)
+        risk_analysis.index = categories
+        risk_analysis['value_at_risk'] = risk_analysis['value_at_risk'].astype(float)
         risk_analysis['failure_rate'] = (risk_analysis['status'] / risk_analysis['trade_id']).round(3)
-        
         return risk_analysis
     
+    @_step
     def settlement_delay_analysis(self) -> pd.DataFrame:
         """Analyze settlement delays"""
-        # Calculate delay in days
-        delayed_trades = self.df[self.df['actual_settlement_date'].notna()].copy()
-        delayed_trades['delay_days'] = (
-            delayed_trades['actual_settlement_date'] - delayed_trades['settlement_date']
-        ).dt.days
-        
-        # Only consider positive delays (actual after expected)
-        delayed_trades = delayed_trades[delayed_trades['delay_days'] > 0]
-        
-        delay_analysis = delayed_trades.groupby('symbol').agg({
-            'delay_days': ['mean', 'max', 'count']
-        }).round(1)
-        
-        delay_analysis.columns = ['avg_delay', 'max_delay', 'delayed_trades_count']
-        return delay_analysis.sort_values('avg_delay', ascending=False)
+        if self.mode == 'pushdown':
+            delay_analysis = self._query('settlement_delay_analysis', f"""
+            SELECT symbol,
+                   avg(delay_days)::float8 AS avg_delay,
+                   max(delay_days) AS max_delay,
+                   count(*) AS delayed_trades_count
+            FROM (
+                SELECT symbol,
+                       floor(extract(epoch FROM actual_settlement_date - settlement_date) / 86400)::int AS delay_days
+                FROM trades
+                WHERE {self.window_sql} AND actual_settlement_date IS NOT NULL
+            ) delays
+            WHERE delay_days > 0
+            GROUP BY symbol
+            """).set_index('symbol').sort_index().round(1)
+            return delay_analysis.sort_values('avg_delay', ascending=False)
+
+        return self._cached('settlement_delay_analysis', trade_grain.settlement_delay_analysis)
     
+    @_step
+    def quantile_analysis(self, quantiles=QUANTILES) -> pd.DataFrame:
+        """Quantiles of value at risk and of settlement delay (days, settled trades only).
+
+        Exact in memory, pushdown and incremental mode; streaming mode reads
+        them off mergeable sketches, within 1% relative error.
+        """
+        quantiles = tuple(float(q) for q in quantiles)
+        if self.mode == 'pushdown':
+            return self._pushdown_quantile_analysis(quantiles)
+        if self.mode == 'incremental':
+            return self._cached(f'quantile_analysis{quantiles}', lambda grain: self._pushdown_quantile_analysis(quantiles))
+        if self.mode == 'streaming':
+            self._state()
+            values = {name: [sketch.quantile(q) for q in quantiles] for name, sketch in self.sketches.items()}
+            return pd.DataFrame.from_dict(values, orient='index', columns=list(quantiles))
+        return self._cached(f'quantile_analysis{quantiles}', lambda grain: pd.DataFrame({
+            'value_at_risk': self.df['value_at_risk'].astype(float).quantile(list(quantiles)),
+            'settlement_delay_days': pd.Series(trade_stream.delay_days(self.df)).quantile(list(quantiles)),
+        }).T)
+
+    def _pushdown_quantile_analysis(self, quantiles) -> pd.DataFrame:
+        # percentile_cont skips NULLs and interpolates linearly, like Series.quantile
+        levels = "ARRAY[" + ", ".join(repr(q) for q in quantiles) + "]::float8[]"
+        row = self._query('quantile_analysis', f"""
+        SELECT percentile_cont({levels}) WITHIN GROUP (ORDER BY value_at_risk::float8) AS value_at_risk,
+               percentile_cont({levels}) WITHIN GROUP (
+                   ORDER BY floor(extract(epoch FROM actual_settlement_date - settlement_date) / 86400)::float8
+               ) AS settlement_delay_days
+        FROM trades
+        WHERE {self.window_sql}
+        """).iloc[0]
+        values = {name: row[name] or [np.nan] * len(quantiles) for name in ('value_at_risk', 'settlement_delay_days')}
+        return pd.DataFrame.from_dict(values, orient='index', columns=list(quantiles)).astype(float)
+
+    @_step
     def correlation_analysis(self) -> pd.DataFrame:
         """Find correlations between trade attributes and failures"""
-        # Prepare data for correlation
-        corr_df = self.df.copy()
-        corr_df['is_failed'] = (corr_df['status'] == 'FAILED').astype(int)
-        corr_df['is_sell'] = (corr_df['quantity'] < 0).astype(int)
-        corr_df['abs_quantity'] = corr_df['quantity'].abs()
-        
-        # Select numeric columns for correlation
-        numeric_cols = ['quantity', 'price', 'value_at_risk', 'abs_quantity', 'is_failed', 'is_sell']
-        correlation_matrix = corr_df[numeric_cols].corr()
-        
-        return correlation_matrix
+        if self.mode == 'pushdown':
+            return self._pushdown_correlation_analysis()
+        if self.mode in ('incremental', 'streaming'):
+            # Correlations are not additive per grain, so they are queried (and cached until refresh)
+            return self._cached('correlation_analysis', lambda grain: self._pushdown_correlation_analysis())
+        return self._cached('correlation_analysis', lambda grain: self._frame_correlation_analysis())
+
+    def _frame_correlation_analysis(self) -> pd.DataFrame:
+        # Only the six derived columns are materialised; self.df is left untouched
+        quantity = self.df['quantity']
+        corr_df = pd.DataFrame({
+            'quantity': quantity,
+            'price': self.df['price'],
+            'value_at_risk': self.df['value_at_risk'],
+            'abs_quantity': quantity.abs(),
+            'is_failed': (self.df['status'] == 'FAILED').astype(int),
+            'is_sell': (quantity < 0).astype(int),
+        })
+        return corr_df.corr()
+
+    def _pushdown_correlation_analysis(self) -> pd.DataFrame:
+        # corr() skips rows where either side is NULL, like pandas' pairwise corr.
+        # OFFSET 0 keeps the subquery from being inlined, so each cast runs once per row
+        names = list(CORRELATION_COLUMNS)
+        pairs = [(a, b) for i, a in enumerate(names) for b in names[i:]]
+        columns = ", ".join(f"{expr} AS {name}" for name, expr in CORRELATION_COLUMNS.items())
+        row = self._query('correlation_analysis',
+            "SELECT " + ", ".join(f"corr({a}, {b}) AS c{i}" for i, (a, b) in enumerate(pairs))
+            + f" FROM (SELECT {columns} FROM trades WHERE {self.window_sql} OFFSET 0) t"
+        ).iloc[0]
+        matrix = pd.DataFrame(np.nan, index=names, columns=names)
+        for i, (a, b) in enumerate(pairs):
+            matrix.loc[a, b] = matrix.loc[b, a] = row[f"c{i}"]
+        return matrix.astype(float)
     
     def generate_report(self):
         """Generate comprehensive analysis report"""
@@ -174,6 +401,8 @@ class TradeAnalyzer:
     
     def plot_analysis(self):
         """Create visualization plots"""
+        import matplotlib.pyplot as plt   # plotting stack only loads when something is plotted
+
         fig, axes = plt.subplots(2, 2, figsize=(15, 10))
         
         # Plot 1: Failure rate by symbol
@@ -0,0 +1,200 @@
+# trade_grain.py
+"""Mergeable aggregate state shared by TradeAnalyzer's memory and incremental modes.
+
+A grain row holds additive counters for all trades sharing
+(window_day, symbol, trade_hour, trade_day, risk_bucket). It is built either
+in SQL (grain_query) or in one vectorized pass over a DataFrame
+(grain_from_frame). Grain tables built from disjoint sets of trades merge by
+summing, whole days drop out with expire(), and every TradeAnalyzer analysis
+except correlation can be derived from the grain table alone.
+"""
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+VAR_BINS = [0, 1000, 5000, 10000, 50000, float('inf')]
+VAR_LABELS = ['Very Low', 'Low', 'Medium', 'High', 'Very High']
+NO_BUCKET = -1   # value_at_risk NULL or <= 0: outside every pd.cut bin
+
+GRAIN_KEYS = ['window_day', 'symbol', 'trade_hour', 'trade_day', 'risk_bucket']
+SUM_COLUMNS = ['trades', 'failed', 'settled', 'var_sum', 'var_count', 'delay_sum', 'delay_count']
+MIN_COLUMNS = ['first_trade_date']
+MAX_COLUMNS = ['last_trade_date', 'delay_max']
+
+def risk_bucket_sql(column: str = 'value_at_risk') -> str:
+    """SQL for the VAR_BINS index of `column`, right-closed like pd.cut"""
+    cases = " ".join(f"WHEN {column} <= {hi} THEN {i}" for i, hi in enumerate(VAR_BINS[1:-1]))
+    return f"CASE WHEN {column} IS NULL OR {column} <= 0 THEN {NO_BUCKET} {cases} ELSE {len(VAR_LABELS) - 1} END"
+
+def grain_query(where: str) -> str:
+    """Aggregate the trades matching `where` into grain rows"""
+    # window_day is the day of (trade_date - 1us), so a row is inside the window
+    # `trade_date > D 00:00` exactly when its window_day >= D
+    return f"""
+    SELECT (trade_date - INTERVAL '1 microsecond')::date AS window_day,
+           symbol,
+           extract(hour FROM trade_date)::int AS trade_hour,
+           to_char(trade_date, 'FMDay') AS trade_day,
+           {risk_bucket_sql()} AS risk_bucket,
+           count(*) AS trades,
+           count(*) FILTER (WHERE status = 'FAILED') AS failed,
+           count(*) FILTER (WHERE status = 'SETTLED') AS settled,
+           coalesce(sum(value_at_risk), 0)::float8 AS var_sum,
+           count(value_at_risk) AS var_count,
+           coalesce(sum(delay_days) FILTER (WHERE delay_days > 0), 0) AS delay_sum,
+           count(*) FILTER (WHERE delay_days > 0) AS delay_count,
+           min(trade_date) AS first_trade_date,
+           max(trade_date) AS last_trade_date,
+           max(delay_days) FILTER (WHERE delay_days > 0) AS delay_max
+    FROM (
+        SELECT trade_date, symbol, status, value_at_risk,
+               floor(extract(epoch FROM actual_settlement_date - settlement_date) / 86400)::int AS delay_days
+        FROM trades
+        WHERE {where}
+    ) t
+    GROUP BY 1, 2, 3, 4, 5
+    """
+
+DAY_NAMES = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+_NS_PER_HOUR = 3600 * 10**9
+_NS_PER_DAY = 24 * _NS_PER_HOUR
+
+def grain_from_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Same grain rows as grain_query(), computed in one vectorized pass over a trades frame.
+
+    Every grain key is turned into a small integer code and the codes are
+    packed into one int64 key, so a single hash groupby of plain numeric
+    columns (sum/min/max, no Python callables) builds the whole table.
+    The source frame is not modified.
+    """
+    if not len(df):
+        return empty()
+    trade_ns = df['trade_date'].to_numpy('datetime64[ns]').view('int64')
+    window_day = (trade_ns - 1) // _NS_PER_DAY
+    trade_hour = (trade_ns // _NS_PER_HOUR) % 24
+    dow = (trade_ns // _NS_PER_DAY + 3) % 7    # 1970-01-01 was a Thursday
+    if isinstance(df['symbol'].dtype, pd.CategoricalDtype):
+        symbol_code, symbols = df['symbol'].cat.codes.to_numpy(), df['symbol'].cat.categories
+    else:
+        symbol_code, symbols = pd.factorize(df['symbol'])
+
+    var = df['value_at_risk'].to_numpy(dtype=float, na_value=np.nan)
+    binned = var > 0                           # False for NaN as well
+    risk_bucket = np.where(binned, np.searchsorted(VAR_BINS[1:-1], var, side='left'), NO_BUCKET)
+
+    delay_ns = (df['actual_settlement_date'] - df['settlement_date']).to_numpy('timedelta64[ns]')
+    delay_days = np.floor_divide(delay_ns.view('int64'), _NS_PER_DAY)
+    delayed = ~np.isnat(delay_ns) & (delay_days > 0)
+
+    day_base = window_day.min()
+    key = window_day - day_base
+    for code, size in ((symbol_code, len(symbols)), (trade_hour, 24), (dow, 7), (risk_bucket + 1, len(VAR_LABELS) + 1)):
+        key = key * size + code
+
+    columns = pd.DataFrame({
+        'trades': np.ones(len(df), dtype=np.int64),
+        'failed': (df['status'] == 'FAILED').to_numpy(np.int64),
+        'settled': (df['status'] == 'SETTLED').to_numpy(np.int64),
+        'var_sum': np.where(np.isnan(var), 0.0, var),
+        'var_count': (~np.isnan(var)).astype(np.int64),
+        'delay_sum': np.where(delayed, delay_days, 0),
+        'delay_count': delayed.astype(np.int64),
+        'first_trade_date': trade_ns,
+        'last_trade_date': trade_ns,
+        'delay_max': np.where(delayed, delay_days.astype(float), np.nan),
+    })
+    aggs = {**{c: 'sum' for c in SUM_COLUMNS}, **{c: 'min' for c in MIN_COLUMNS}, **{c: 'max' for c in MAX_COLUMNS}}
+    grain = columns.groupby(key, sort=False).agg(aggs)
+
+    # Unpack the keys, innermost code first
+    rest = grain.index.to_numpy()
+    codes = {}
+    for name, size in (('risk_bucket', len(VAR_LABELS) + 1), ('dow', 7), ('trade_hour', 24), ('symbol', len(symbols))):
+        rest, codes[name] = np.divmod(rest, size)
+    grain = grain.reset_index(drop=True)
+    grain.insert(0, 'window_day', ((rest + day_base) * _NS_PER_DAY).astype('datetime64[ns]'))
+    grain.insert(1, 'symbol', np.asarray(symbols)[codes['symbol']])
+    grain.insert(2, 'trade_hour', codes['trade_hour'])
+    grain.insert(3, 'trade_day', DAY_NAMES[codes['dow']])
+    grain.insert(4, 'risk_bucket', codes['risk_bucket'] - 1)
+    for column in ('first_trade_date', 'last_trade_date'):
+        grain[column] = grain[column].astype('datetime64[ns]')
+    return grain
+
+def empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=GRAIN_KEYS + SUM_COLUMNS + MIN_COLUMNS + MAX_COLUMNS)
+
+def merge(*grains: pd.DataFrame) -> pd.DataFrame:
+    """Combine grain tables built from disjoint sets of trades"""
+    frames = [g for g in grains if len(g)]
+    if not frames:
+        return empty()
+    combined = pd.concat(frames, ignore_index=True)
+    if len(frames) == 1:
+        return combined
+    aggs = {**{c: 'sum' for c in SUM_COLUMNS}, **{c: 'min' for c in MIN_COLUMNS}, **{c: 'max' for c in MAX_COLUMNS}}
+    return combined.groupby(GRAIN_KEYS, as_index=False, sort=False).agg(aggs)
+
+def expire(grain: pd.DataFrame, first_day) -> pd.DataFrame:
+    """Drop grain rows for days before `first_day`, the oldest day still in the window"""
+    if not len(grain):
+        return grain
+    return grain[pd.to_datetime(grain['window_day']) >= pd.Timestamp(first_day)].reset_index(drop=True)
+
+def basic_stats(grain: pd.DataFrame) -> Dict[str, Any]:
+    total = int(grain['trades'].sum())
+    var_count = grain['var_count'].sum()
+    stats = {
+        'total_trades': total,
+        'failed_trades': int(grain['failed'].sum()),
+        'settled_trades': int(grain['settled'].sum()),
+        'total_value': float(grain['var_sum'].sum()),
+        'avg_trade_size': grain['var_sum'].sum() / var_count if var_count else np.nan,
+        'date_range': {
+            'start': pd.Timestamp(grain['first_trade_date'].min()),
+            'end': pd.Timestamp(grain['last_trade_date'].max())
+        }
+    }
+    stats['failure_rate'] = stats['failed_trades'] / stats['total_trades']
+    return stats
+
+def failure_analysis_by_symbol(grain: pd.DataFrame) -> pd.DataFrame:
+    by_symbol = grain.groupby('symbol')[['trades', 'failed', 'var_sum', 'var_count']].sum()
+    result = pd.DataFrame({
+        'total_trades': by_symbol['trades'].astype('int64'),
+        'failed_trades': by_symbol['failed'].astype('int64'),
+        'total_var': by_symbol['var_sum'].astype(float),
+        'avg_var': by_symbol['var_sum'] / by_symbol['var_count'].replace(0, np.nan),
+    }).round(2)
+    result['failure_rate'] = (result['failed_trades'] / result['total_trades']).round(3)
+    return result.sort_values('failure_rate', ascending=False)
+
+def time_based_analysis(grain: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    grouped = {}
+    for name, key in (('hourly', 'trade_hour'), ('daily', 'trade_day')):
+        frame = grain.groupby(key)[['trades', 'failed']].sum().astype('int64')
+        frame.columns = ['trade_id', 'status']
+        frame['failure_rate'] = (frame['status'] / frame['trade_id']).round(3)
+        grouped[name] = frame
+    return grouped
+
+def value_at_risk_analysis(grain: pd.DataFrame) -> pd.DataFrame:
+    binned = grain[grain['risk_bucket'] != NO_BUCKET]
+    found = binned.groupby('risk_bucket')[['trades', 'failed', 'var_sum']].sum()
+    risk_analysis = found.reindex(range(len(VAR_LABELS)), fill_value=0)
+    risk_analysis.columns = ['trade_id', 'status', 'value_at_risk']
+    risk_analysis = risk_analysis.astype({'trade_id': 'int64', 'status': 'int64', 'value_at_risk': float})
+    risk_analysis.index = pd.CategoricalIndex(VAR_LABELS, categories=VAR_LABELS, ordered=True, name='risk_category')
+    risk_analysis['failure_rate'] = (risk_analysis['status'] / risk_analysis['trade_id']).round(3)
+    return risk_analysis
+
+def settlement_delay_analysis(grain: pd.DataFrame) -> pd.DataFrame:
+    delayed = grain[grain['delay_count'] > 0]
+    by_symbol = delayed.groupby('symbol').agg({'delay_sum': 'sum', 'delay_count': 'sum', 'delay_max': 'max'})
+    delay_analysis = pd.DataFrame({
+        'avg_delay': by_symbol['delay_sum'] / by_symbol['delay_count'],
+        'max_delay': by_symbol['delay_max'].astype('int64'),
+        'delayed_trades_count': by_symbol['delay_count'].astype('int64'),
+    }).round(1)
+    return delay_analysis.sort_values('avg_delay', ascending=False)
@@ -0,0 +1,12 @@
+# trade_queries.py
+"""SQL shared by api.py and the index advisor (optimizing_db.py).
+
+Importing it has no side effects, so tools that only need the query text do
+not load the model or build the FastAPI app.
+"""
+
+TRADE_FIELDS = ["trade_id", "symbol", "quantity", "price", "status", "value_at_risk", "trade_date", "failure_reason"]
+TRADE_SELECT = (
+    "SELECT trade_id, symbol, quantity::float8, price::float8, status, "
+    "value_at_risk::float8, trade_date, failure_reason FROM trades"
+)
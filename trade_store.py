@@ -0,0 +1,104 @@
+# trade_store.py
+"""Compact, typed in-memory trade frames for analysis.
+
+Rows are streamed out of Postgres with COPY into a spooled temp file and
+parsed in chunks straight into their final dtypes: categoricals for
+low-cardinality strings, int32 quantities, float64 amounts and
+datetime64[ns] dates. Only the requested columns are read, so a frame costs
+about estimate_bytes() and never holds Python objects per cell.
+"""
+import tempfile
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from db import connection
+
+# Column -> (SELECT expression, in-memory dtype)
+STORE_COLUMNS: Dict[str, tuple] = {
+    'trade_id': ('trade_id', 'object'),
+    'symbol': ('symbol', 'category'),
+    'status': ('status', 'category'),
+    'failure_reason': ('failure_reason', 'category'),
+    'trade_currency': ('trade_currency', 'category'),
+    'quantity': ('quantity', 'int32'),
+    'price': ('price::float8', 'float64'),
+    'value_at_risk': ('value_at_risk::float8', 'float64'),
+    'is_margin_trade': ('is_margin_trade::int', 'bool'),
+    'trade_date': ('trade_date', 'datetime64[ns]'),
+    'settlement_date': ('settlement_date', 'datetime64[ns]'),
+    'actual_settlement_date': ('actual_settlement_date', 'datetime64[ns]'),
+}
+
+# Everything TradeAnalyzer's memory mode reads
+ANALYSIS_COLUMNS = [
+    'symbol', 'status', 'quantity', 'price', 'value_at_risk',
+    'trade_date', 'settlement_date', 'actual_settlement_date',
+]
+
+CHUNK_ROWS = 250_000
+SPOOL_BYTES = 64 * 1024 * 1024   # COPY output beyond this spills to a temp file
+
+_CSV_DTYPES = {'category': 'category', 'int32': 'int32', 'float64': 'float64',
+               'bool': 'int8', 'datetime64[ns]': 'object', 'object': 'object'}
+
+# Bytes per row by dtype; categorical codes are int8 below 128 categories and
+# object columns (trade_id) pay for a pointer plus a short Python str
+_ITEM_BYTES = {'category': 1, 'int32': 4, 'float64': 8, 'bool': 1, 'datetime64[ns]': 8, 'object': 72}
+
+def estimate_bytes(n_rows: int, columns: Sequence[str] = ANALYSIS_COLUMNS) -> int:
+    """Approximate frame size for `n_rows` trades, e.g. to budget memory per million trades"""
+    return n_rows * sum(_ITEM_BYTES[STORE_COLUMNS[c][1]] for c in columns)
+
+def _typed(chunk: pd.DataFrame, columns: Sequence[str]) -> pd.DataFrame:
+    for column in columns:
+        dtype = STORE_COLUMNS[column][1]
+        if dtype == 'datetime64[ns]':
+            chunk[column] = pd.to_datetime(chunk[column], format='ISO8601')
+        elif dtype == 'bool':
+            chunk[column] = chunk[column].astype(bool)
+    return chunk
+
+def _concat(chunks: List[pd.DataFrame], columns: Sequence[str]) -> pd.DataFrame:
+    if len(chunks) == 1:
+        return chunks[0]
+    frame = {}
+    for column in columns:
+        parts = [chunk[column] for chunk in chunks]
+        if STORE_COLUMNS[column][1] == 'category':
+            # Chunks see different category sets; union them instead of falling back to object
+            frame[column] = pd.api.types.union_categoricals(parts, ignore_order=True)
+        else:
+            frame[column] = np.concatenate([p.to_numpy() for p in parts])
+    return pd.DataFrame(frame, columns=list(columns))
+
+def load_trades(where: str = "TRUE", columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Trades matching the SQL predicate `where`, as a compact typed frame of `columns`"""
+    columns = list(columns or ANALYSIS_COLUMNS)
+    unknown = set(columns) - set(STORE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown trade columns: {sorted(unknown)}")
+    select = ", ".join(STORE_COLUMNS[c][0] for c in columns)
+    copy_sql = f"COPY (SELECT {select} FROM trades WHERE {where}) TO STDOUT WITH (FORMAT csv)"
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode='w+b') as buf:
+        with connection() as conn, conn.cursor() as cur, metrics.db_query("trade_store.load_trades") as query:
+            cur.execute("SET LOCAL DateStyle TO 'ISO, YMD'")   # timestamps as text pandas parses fast
+            cur.copy_expert(copy_sql, buf)
+            query.rows = max(cur.rowcount, 0)
+        buf.seek(0)
+        reader = pd.read_csv(
+            buf, names=columns, header=None, chunksize=CHUNK_ROWS,
+            dtype={c: _CSV_DTYPES[STORE_COLUMNS[c][1]] for c in columns},
+            keep_default_na=False, na_values=[''],
+        )
+        chunks = [_typed(chunk, columns) for chunk in reader]
+
+    if not chunks:
+        return pd.DataFrame({c: pd.Series(dtype=STORE_COLUMNS[c][1]) for c in columns})
+    return _concat(chunks, columns)
+
+def memory_bytes(frame: pd.DataFrame) -> int:
+    return int(frame.memory_usage(index=True, deep=True).sum())
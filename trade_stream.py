@@ -0,0 +1,186 @@
+# trade_stream.py
+"""Streaming aggregation for windows larger than RAM.
+
+Trades are read in fixed-size chunks from a server-side cursor and each
+chunk is folded into mergeable partial state: a trade_grain table (counts,
+sums, min/max) and QuantileSketches for value at risk and settlement delay.
+Only one chunk is held at a time. With workers > 1 the window is split into
+trade_date ranges streamed by a process pool, and the partials are merged
+in trade_date order. Counts and min/max do not depend on the worker count;
+float sums match the single-worker result up to rounding, and repeat runs
+with the same worker count give identical results.
+"""
+import math
+import multiprocessing
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import trade_grain
+from db import connection
+
+CHUNK_ROWS = 50_000   # ~1.4KB of Python row tuples per row while a chunk is in flight
+
+# Columns a grain needs, in cursor order
+STREAM_SELECT = [
+    ('symbol', 'symbol'),
+    ('status', 'status'),
+    ('value_at_risk', 'value_at_risk::float8'),
+    ('trade_date', 'trade_date'),
+    ('settlement_date', 'settlement_date'),
+    ('actual_settlement_date', 'actual_settlement_date'),
+]
+
+_NS_PER_DAY = 24 * 3600 * 10**9
+
+class QuantileSketch:
+    """Mergeable quantile sketch with a relative-error guarantee (DDSketch).
+
+    Values are counted in logarithmic buckets, so every quantile is within
+    `relative_accuracy` of a value actually observed at that rank, whatever
+    the number of values. Sketches built on disjoint data merge by adding
+    bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}   # keyed on -value
+        self.zero = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values) -> 'QuantileSketch':
+        """Add an array of values; NaN is ignored"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.zero += int((values == 0).sum())
+        for store, part in ((self.positive, values[values > 0]), (self.negative, -values[values < 0])):
+            keys, counts = np.unique(np.ceil(np.log(part) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, n in zip(keys.tolist(), counts.tolist()):
+                store[key] = store.get(key, 0) + n
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for store, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, n in theirs.items():
+                store[key] = store.get(key, 0) + n
+        self.zero += other.zero
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _bucket_value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return np.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        value = self.max
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                value = -self._bucket_value(key)
+                break
+        else:
+            seen += self.zero
+            if seen > rank:
+                return 0.0
+            for key in sorted(self.positive):
+                seen += self.positive[key]
+                if seen > rank:
+                    value = self._bucket_value(key)
+                    break
+        return min(max(value, self.min), self.max)
+
+def empty_sketches() -> Dict[str, QuantileSketch]:
+    return {'value_at_risk': QuantileSketch(), 'settlement_delay_days': QuantileSketch()}
+
+def _frame(rows: List[tuple]) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(rows, columns=[name for name, _ in STREAM_SELECT])
+    frame['value_at_risk'] = frame['value_at_risk'].astype(float)
+    for column in ('trade_date', 'settlement_date', 'actual_settlement_date'):
+        frame[column] = pd.to_datetime(frame[column])
+    return frame
+
+def delay_days(frame: pd.DataFrame) -> np.ndarray:
+    """Whole days between settlement_date and actual_settlement_date, NaN while unsettled"""
+    delay_ns = (frame['actual_settlement_date'] - frame['settlement_date']).to_numpy('timedelta64[ns]')
+    days = np.floor_divide(delay_ns.view('int64'), _NS_PER_DAY).astype(float)
+    days[np.isnat(delay_ns)] = np.nan
+    return days
+
+def stream_partial(after: datetime, until: datetime,
+                   chunk_rows: int = CHUNK_ROWS) -> Tuple[pd.DataFrame, Dict[str, QuantileSketch]]:
+    """Grain table and quantile sketches for trades with `after < trade_date <= until`"""
+    grain = trade_grain.empty()
+    sketches = empty_sketches()
+    select = ", ".join(expr for _, expr in STREAM_SELECT)
+    with connection() as conn:
+        with conn.cursor(name="trades_stream") as cur:
+            cur.itersize = chunk_rows
+            cur.execute(f"SELECT {select} FROM trades WHERE trade_date > %s AND trade_date <= %s", (after, until))
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                chunk = _frame(rows)
+                grain = trade_grain.merge(grain, trade_grain.grain_from_frame(chunk))
+                sketches['value_at_risk'].add(chunk['value_at_risk'].to_numpy())
+                sketches['settlement_delay_days'].add(delay_days(chunk))
+    return grain, sketches
+
+def _stream_range(args) -> Tuple[pd.DataFrame, Dict[str, QuantileSketch]]:
+    return stream_partial(*args)
+
+def merge_partials(partials) -> Tuple[pd.DataFrame, Dict[str, QuantileSketch]]:
+    grains, sketches = [], {}
+    for grain, partial_sketches in partials:
+        grains.append(grain)
+        for name, sketch in partial_sketches.items():
+            if name in sketches:
+                sketches[name].merge(sketch)
+            else:
+                sketches[name] = sketch
+    return trade_grain.merge(*grains), sketches
+
+def stream_window(window_days: int = 90, workers: int = 1,
+                  chunk_rows: int = CHUNK_ROWS) -> Tuple[pd.DataFrame, Dict[str, QuantileSketch]]:
+    """Grain table and quantile sketches for the last `window_days` days of trades.
+
+    With workers > 1 the window is cut into equal trade_date spans, one per
+    worker process, each streaming its span on its own connection.
+    """
+    with connection() as conn, conn.cursor() as cur:
+        # Pin the upper bound so every worker sees the same window
+        cur.execute(
+            "SELECT (CURRENT_DATE - %s)::timestamp, max(trade_date) FROM trades WHERE trade_date > CURRENT_DATE - %s",
+            (window_days, window_days),
+        )
+        after, until = cur.fetchone()
+    if until is None:
+        return trade_grain.empty(), empty_sketches()
+
+    workers = max(1, workers)
+    if workers == 1:
+        return stream_partial(after, until, chunk_rows)
+    edges = [after + (until - after) * i / workers for i in range(workers)] + [until]
+    ranges = [(edges[i], edges[i + 1], chunk_rows) for i in range(workers)]
+    with multiprocessing.Pool(workers) as pool:
+        # Ordered, so the float sums do not depend on which worker finishes first
+        return merge_partials(pool.imap(_stream_range, ranges))